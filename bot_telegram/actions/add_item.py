@@ -6,6 +6,7 @@ from bot_telegram.actions import base
 from bot_telegram.callback_data import CallbackData
 from bot_telegram.filters import subscription_filter
 from core import models as core_models
+from core.service import parsing
 from parser_price import models as parser_price_models
 
 
@@ -44,6 +45,9 @@ class AddItemAction(base.BaseAction):
             item: parser_price_models.Item
     ) -> None:
         item.vendor_code = int(message.text)
+        # предмет запрашивается сразу, чтобы при парсинге не искать хост basket-NN.wb.ru
+        categories, _ = parsing.get_categories([item.vendor_code])
+        item.category = categories.get(item.vendor_code)
         item.save()
         text = f"{bot.Formatter.link(item.vendor_code, item.link)} добавлен для отслеживания."
         bot.send_message(user.telegram_chat_id, text)
@@ -0,0 +1,45 @@
+import argparse
+
+from django.db import connection
+
+from core.management.commands import core_command
+from core.service import benchmarks
+
+
+class Command(core_command.CoreCommand):
+    help = ("Замеряет время, количество запросов к БД и пиковую память парсинга и подготовки таблиц "
+            "на синтетических данных в тестовой БД и подменном сервере API Wildberries")
+
+    def add_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument("--items", type = int, default = self.settings.BENCHMARKS_ITEMS_AMOUNT)
+        parser.add_argument("--keywords", type = int, default = self.settings.BENCHMARKS_KEYWORDS_AMOUNT)
+        parser.add_argument("--days", type = int, default = self.settings.MAX_HISTORY_DEPTH)
+        parser.add_argument("--pages", type = int, default = self.settings.BENCHMARKS_PAGES_AMOUNT)
+        parser.add_argument(
+            "--latency",
+            type = float,
+            nargs = 2,
+            default = self.settings.BENCHMARKS_LATENCY,
+            metavar = ("MIN", "MAX")
+        )
+        parser.add_argument("--only", nargs = "+", help = "названия замеров, по умолчанию - все")
+        parser.add_argument("--no-memory", action = "store_true", help = "не замерять пиковую память")
+
+    def handle(self, *args, **options) -> None:
+        scale = benchmarks.Scale(options["items"], options["keywords"], options["days"], options["pages"])
+        old_database_name = connection.settings_dict["NAME"]
+        # данные создаются в отдельной БД, чтобы не смешиваться с настоящими
+        connection.creation.create_test_db(verbosity = 0, autoclobber = True)
+        try:
+            results = benchmarks.run_benchmarks(
+                scale,
+                options["only"],
+                tuple(options["latency"]),
+                not options["no_memory"]
+            )
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity = 0)
+
+        previous = benchmarks.get_previous_results(scale)
+        benchmarks.save_results(scale, results)
+        self.stdout.write(benchmarks.format_results(results, previous))
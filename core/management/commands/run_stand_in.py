@@ -0,0 +1,38 @@
+import argparse
+
+from core.management.commands import core_command
+from core.service import stand_in
+
+
+class Command(core_command.CoreCommand):
+    help = "Запускает подменный сервер API Wildberries с записанными ответами (адрес прописывается в STAND_IN_URL)"
+
+    def add_arguments(self, parser: argparse.ArgumentParser):
+        parser.add_argument("--host", default = self.settings.STAND_IN_ADDRESS[0])
+        parser.add_argument("--port", type = int, default = self.settings.STAND_IN_ADDRESS[1])
+        parser.add_argument("--fixtures", default = self.settings.STAND_IN_FIXTURES_PATH)
+        parser.add_argument(
+            "--latency",
+            type = float,
+            nargs = 2,
+            default = self.settings.STAND_IN_LATENCY,
+            metavar = ("MIN", "MAX")
+        )
+        parser.add_argument("--error-rate", type = float, default = self.settings.STAND_IN_ERROR_RATE)
+        parser.add_argument("--rate-limit", type = float, default = self.settings.STAND_IN_RATE_LIMIT)
+
+    def handle(self, *args, **options) -> None:
+        server = stand_in.StandInServer(
+            (options["host"], options["port"]),
+            stand_in.FixtureStore(options["fixtures"]),
+            tuple(options["latency"]),
+            options["error_rate"],
+            options["rate_limit"]
+        )
+        self.logger.info(f"Stand-in server: {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -1,3 +1,5 @@
+import abc
+import dataclasses
 import datetime
 import os
 
@@ -9,6 +11,16 @@ class UnsuccessfulParsing(Exception):
     pass
 
 
+@dataclasses.dataclass
+class ShardResult:
+    """Результат парсинга одной части работы в процессе движка запуска."""
+
+    # {идентификатор единицы работы: ошибка}
+    errors: dict[int, Exception]
+    # данные для завершения парсинга в основном процессе
+    data: list = dataclasses.field(default_factory = list)
+
+
 class Parser:
     settings = settings.Settings()
     logger = logger.Logger(settings.APP_NAME)
@@ -34,3 +46,22 @@ class Parser:
             self.parsing.not_parsed_items = None
             self.parsing.success = True
             self.parsing.save()
+
+
+class EngineParserMixin(Parser, abc.ABC):
+    """Парсер, который можно запустить движком запуска (core.service.run_engine)."""
+
+    @abc.abstractmethod
+    def get_shards(self, workers_amount: int) -> list[list[int]]:
+        """
+        Загружает работу один раз в основном процессе и делит ее на части - списки идентификаторов единиц работы,
+        которые парсятся в workers_amount процессах движка запуска.
+        """
+
+    @abc.abstractmethod
+    def parse_shard(self, shard: list[int]) -> ShardResult:
+        pass
+
+    @abc.abstractmethod
+    def finish(self, errors: dict[int, Exception], data: list) -> None:
+        """Завершает парсинг в основном процессе после обработки всех частей."""
@@ -0,0 +1,151 @@
+import bisect
+import json
+import threading
+from pathlib import Path
+from typing import Self
+
+from core.service import file_lock
+from core.settings import Settings
+
+
+settings = Settings()
+
+Path(settings.PARSING_RESOURCES_PATH).mkdir(parents = True, exist_ok = True)
+BASKET_RANGES_PATH = f"{settings.PARSING_RESOURCES_PATH}/basket_ranges.json"
+
+# [первый vol, последний vol, basket]
+BasketRange = list[int]
+
+
+class BasketResolver:
+    """
+    Индекс диапазонов vol, обслуживаемых каждым basket-NN.wb.ru.
+
+    Каждый basket хранит непрерывный диапазон vol, поэтому для уже встречавшихся vol хост находится
+    бинарным поиском, а перебор хостов нужен только для новых vol.
+    """
+
+    def __init__(self, ranges: list[BasketRange] = ()) -> None:
+        # отсортированы по первому vol и не пересекаются
+        self.ranges: list[BasketRange] = []
+        self.starts: list[int] = []
+        # {vol: basket} - узнанные за запуск, применяются поверх сохраненных другими процессами диапазонов
+        self.learned: dict[int, int] = {}
+        self.lock = threading.Lock()
+        for first, last, basket in ranges:
+            self.learn_range(first, last, basket)
+
+    @classmethod
+    def load(cls) -> Self:
+        try:
+            with open(BASKET_RANGES_PATH, 'r') as file:
+                ranges = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            ranges = []
+        return cls(ranges)
+
+    def save(self) -> None:
+        # чтение, объединение и запись под одной блокировкой - диапазоны, сохраненные другими процессами, не теряются,
+        # а узнанные за запуск vol применяются последними, чтобы исправления устаревших диапазонов не перезаписывались
+        with file_lock.locked(BASKET_RANGES_PATH), self.lock:
+            saved = self.load()
+            for vol, basket in self.learned.items():
+                saved.learn_range(vol, vol, basket)
+            self.ranges = saved.ranges
+            self.starts = saved.starts
+            file_lock.write_json(BASKET_RANGES_PATH, self.ranges)
+
+    def find(self, vol: int) -> int:
+        """Индекс последнего диапазона, начинающегося не позже vol (-1, если такого нет)."""
+        return bisect.bisect_right(self.starts, vol) - 1
+
+    def lookup(self, vol: int) -> int | None:
+        index = self.find(vol)
+        if index >= 0 and self.ranges[index][1] >= vol:
+            basket = self.ranges[index][2]
+        else:
+            basket = None
+        return basket
+
+    def learn(self, vol: int, basket: int) -> None:
+        with self.lock:
+            self.learn_range(vol, vol, basket)
+            self.learned.pop(vol, None)
+            self.learned[vol] = basket
+
+    def learn_range(self, first: int, last: int, basket: int) -> None:
+        for vol in (first, last):
+            index = self.find(vol)
+            if index >= 0 and self.ranges[index][1] >= vol:
+                if self.ranges[index][2] != basket:
+                    # данные устарели - диапазон разбивается
+                    self.split(index, vol, basket)
+                continue
+
+            left = self.ranges[index] if index >= 0 else None
+            right = self.ranges[index + 1] if index + 1 < len(self.ranges) else None
+            if left is not None and left[2] == basket:
+                left[1] = vol
+                if right is not None and right[2] == basket:
+                    # vol соединил два диапазона одного basket
+                    left[1] = right[1]
+                    del self.ranges[index + 1]
+                    del self.starts[index + 1]
+            elif right is not None and right[2] == basket:
+                right[0] = vol
+                self.starts[index + 1] = vol
+            else:
+                self.ranges.insert(index + 1, [vol, vol, basket])
+                self.starts.insert(index + 1, vol)
+
+    def split(self, index: int, vol: int, basket: int) -> None:
+        first, last, old_basket = self.ranges[index]
+        new_ranges = [[first, vol - 1, old_basket], [vol, vol, basket], [vol + 1, last, old_basket]]
+        new_ranges = [x for x in new_ranges if x[0] <= x[1]]
+        self.ranges[index:index + 1] = new_ranges
+        self.starts[index:index + 1] = [x[0] for x in new_ranges]
+        # новый basket мог совпасть с соседним, как и при добавлении vol вне диапазонов
+        self.merge(max(index - 1, 0), index + len(new_ranges) + 1)
+
+    def merge(self, start: int, stop: int) -> None:
+        """Объединяет соседние диапазоны одного basket среди ranges[start:stop]."""
+
+        merged = []
+        for vol_range in self.ranges[start:stop]:
+            if merged and merged[-1][2] == vol_range[2]:
+                merged[-1][1] = vol_range[1]
+            else:
+                merged.append(vol_range)
+        self.ranges[start:stop] = merged
+        self.starts[start:stop] = [x[0] for x in merged]
+
+    def get_weights(self) -> dict[int, int]:
+        """Количество известных vol для каждого basket."""
+
+        weights = {x: 0 for x in range(1, settings.BASKETS_MAX_NUMBER + 1)}
+        for first, last, basket in self.ranges:
+            weights[basket] = weights.get(basket, 0) + last - first + 1
+        return weights
+
+    def get_candidates(self, vol: int) -> tuple[list[int], bool]:
+        """
+        Порядок перебора хостов для vol - от самых вероятных к наименее вероятным,
+        и известен ли хост (тогда он первый).
+
+        Оба значения берутся под одной блокировкой, так как другие потоки изменяют индекс через learn.
+        """
+
+        with self.lock:
+            weights = self.get_weights()
+            basket = self.lookup(vol)
+            if basket is not None:
+                likely = [basket]
+            else:
+                # номера basket растут вместе с vol, поэтому искомый лежит между соседними диапазонами
+                index = self.find(vol)
+                bottom = self.ranges[index][2] if index >= 0 else 1
+                top = self.ranges[index + 1][2] if index + 1 < len(self.ranges) else max(weights)
+                likely = list(range(bottom, top + 1))
+
+        other = sorted((x for x in weights if x not in likely), key = lambda x: (-weights[x], x))
+        return likely + other, basket is not None
@@ -0,0 +1,386 @@
+import contextlib
+import dataclasses
+import datetime
+import json
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core import models as core_models
+from core.service import parsing, stand_in
+from core.settings import Settings
+from parser_position import models as position_models
+from parser_price import models as price_models
+from parser_seller_api import models as seller_api_models
+
+
+settings = Settings()
+
+# первый артикул синтетических товаров
+FIRST_VENDOR_CODE = 10000000
+# первый артикул товаров, которые заполняют страницы выдачи вокруг отслеживаемых
+FIRST_FILLER_VENDOR_CODE = 90000000
+CATEGORIES_AMOUNT = 10
+# каждый SOLD_OUT_EACH товар распродан
+SOLD_OUT_EACH = 10
+# каждый SELLER_API_EACH товар есть в API продавца, СПП остальных оценивается
+SELLER_API_EACH = 4
+# количество товаров, отслеживаемых по одной ключевой фразе
+KEYWORD_ITEMS_AMOUNT = 2
+
+
+@dataclasses.dataclass(frozen = True)
+class Scale:
+    items: int
+    keywords: int
+    days: int
+    pages: int
+
+
+@dataclasses.dataclass
+class BenchmarkResult:
+    name: str
+    wall_time: float
+    queries: int
+    # в байтах, None - память не замерялась
+    peak_memory: int | None
+
+
+class Dataset:
+    """
+    Синтетические данные парсеров заданного масштаба: товары с историей цен, ключевые фразы с историей позиций,
+    а также ответы card.wb.ru и search.wb.ru для подменного сервера.
+    """
+
+    def __init__(self, scale: Scale) -> None:
+        self.scale = scale
+        self.dest = settings.MOSCOW_CITY_DICT["dest"]
+        self.city = settings.MOSCOW_CITY_DICT["name"]
+        self.vendor_codes = list(range(FIRST_VENDOR_CODE, FIRST_VENDOR_CODE + scale.items))
+        self.position_vendor_codes = self.vendor_codes[:min(scale.items, scale.keywords)]
+        # {vendor_code: final_price}
+        self.final_prices = {x: 500 + (x * 37) % 4500 for x in self.vendor_codes}
+        # [(keyword_value, vendor_code)]
+        self.keyword_pairs = [
+            (f"keyword {x // KEYWORD_ITEMS_AMOUNT}", self.position_vendor_codes[x % len(self.position_vendor_codes)])
+            for x in range(scale.keywords)
+        ] if self.position_vendor_codes else []
+        # {(keyword_value, vendor_code): (page, position)}
+        self.search_positions = self.get_search_positions()
+
+        self.user: core_models.ParserUser | None = None
+        self.price_items: list[price_models.Item] = []
+        self.keywords: list[position_models.Keyword] = []
+
+    @staticmethod
+    def is_sold_out(vendor_code: int) -> bool:
+        return vendor_code % SOLD_OUT_EACH == 0
+
+    def get_search_positions(self) -> dict[tuple[str, int], tuple[int, int]]:
+        positions = {}
+        keyword_vendor_codes: dict[str, list[int]] = {}
+        for value, vendor_code in self.keyword_pairs:
+            keyword_vendor_codes.setdefault(value, [])
+            if vendor_code not in keyword_vendor_codes[value]:
+                keyword_vendor_codes[value].append(vendor_code)
+        for number, (value, vendor_codes) in enumerate(keyword_vendor_codes.items()):
+            page = number % self.scale.pages + 1
+            for index, vendor_code in enumerate(vendor_codes):
+                positions[(value, vendor_code)] = (page, (number * 7 + index) % settings.DEFAULT_PAGE_CAPACITY + 1)
+        return positions
+
+    def get_card_product(self, vendor_code: int) -> dict:
+        return {
+            "id": vendor_code,
+            "salePriceU": self.final_prices[vendor_code] * 100,
+            "sizes": [{"stocks": [] if self.is_sold_out(vendor_code) else [{"qty": 1}]}],
+            "feedbacks": vendor_code % 1000,
+            "brand": "Brand",
+            "name": f"Item {vendor_code}"
+        }
+
+    def get_search_page(self, page: int, placed: dict[int, int]) -> dict:
+        """placed - отслеживаемые товары страницы, {position: vendor_code}."""
+
+        if page > self.scale.pages:
+            # страницы закончились, дальше идет другая выдача
+            return {"metadata": {"original": "other"}, "data": {"products": []}}
+        first = FIRST_FILLER_VENDOR_CODE + page * settings.DEFAULT_PAGE_CAPACITY
+        vendor_codes = list(range(first, first + settings.DEFAULT_PAGE_CAPACITY))
+        for position, vendor_code in placed.items():
+            vendor_codes[position - 1] = vendor_code
+        return {"metadata": {}, "data": {"products": [{"id": x} for x in vendor_codes]}}
+
+    def fill_store(self, store: stand_in.FixtureStore, search_base_url: str) -> None:
+        store.put_card_products(self.dest, [self.get_card_product(x) for x in self.vendor_codes])
+        # {(keyword_value, page): {position: vendor_code}}
+        placed: dict[tuple[str, int], dict[int, int]] = {}
+        for (value, vendor_code), (page, position) in self.search_positions.items():
+            placed.setdefault((value, page), {})[position] = vendor_code
+        # с запасом на страницы, запрошенные заранее за концом выдачи
+        pages = range(1, self.scale.pages + settings.SEARCH_PREFETCH_PAGES * 2 + 1)
+        for value in {x for x, _ in self.keyword_pairs}:
+            for page in pages:
+                url = parsing.get_search_url(value, self.dest, page).removeprefix(search_base_url)
+                _, key, _ = stand_in.parse_served_path(f"/search{url}")
+                search_page = self.get_search_page(page, placed.get((value, page), {}))
+                store.put_response(key, 200, json.dumps(search_page).encode())
+
+    def create_parsings(self, parsing_type: str) -> list[core_models.Parsing]:
+        """Парсинги за каждый день истории - от старого к новому, чтобы последний парсинг имел наибольший id."""
+
+        today = datetime.date.today()
+        parsings = core_models.Parsing.objects.bulk_create(
+            [core_models.Parsing(duration = datetime.timedelta(), success = True, type = parsing_type)
+             for _ in range(self.scale.days)]
+        )
+        for number, parsing_object in enumerate(parsings):
+            date = today - datetime.timedelta(self.scale.days - 1 - number)
+            # date и time заполняются текущим временем при создании
+            core_models.Parsing.objects.filter(id = parsing_object.id).update(
+                date = date,
+                time = datetime.datetime.combine(date, datetime.time(12))
+            )
+        return parsings
+
+    def create(self) -> None:
+        self.user = core_models.ParserUser.objects.create(username = "benchmark", subscribed = True)
+        categories = price_models.Category.get_or_create_categories(
+            f"Category {x}" for x in range(CATEGORIES_AMOUNT)
+        )
+        item_categories = {x: categories[f"Category {x % CATEGORIES_AMOUNT}"] for x in self.vendor_codes}
+
+        self.price_items = price_models.Item.objects.bulk_create(
+            [price_models.Item(vendor_code = x, user = self.user, name = f"Item {x}", category = item_categories[x])
+             for x in self.vendor_codes]
+        )
+        seller_api_models.Item.objects.bulk_create(
+            [seller_api_models.Item(
+                vendor_code = x,
+                user = self.user,
+                price = self.final_prices[x] * 2,
+                discount = 30,
+                category = item_categories[x],
+                personal_discount = 100 - round(self.final_prices[x] / (self.final_prices[x] * 2 * 0.7) * 100),
+                final_price = self.final_prices[x]
+            ) for x in self.vendor_codes[::SELLER_API_EACH]]
+        )
+        price_parsings = self.create_parsings(core_models.Parsing.Type.PRICE)
+        price_models.Price.objects.bulk_create(
+            (price_models.Price(
+                item = item,
+                parsing = parsing_object,
+                reviews_amount = item.vendor_code % 1000,
+                price = self.final_prices[item.vendor_code] * 1.4,
+                # цена меняется каждые несколько дней, чтобы появлялись уведомления
+                final_price = self.final_prices[item.vendor_code] + (day + item.vendor_code) // 3 % 2 * 10,
+                personal_discount = 25,
+                sold_out = self.is_sold_out(item.vendor_code)
+            ) for day, parsing_object in enumerate(price_parsings) for item in self.price_items),
+            batch_size = 1000
+        )
+
+        position_items = position_models.Item.objects.bulk_create(
+            [position_models.Item(vendor_code = x, user = self.user) for x in self.position_vendor_codes]
+        )
+        position_items = {x.vendor_code: x for x in position_items}
+        self.keywords = position_models.Keyword.objects.bulk_create(
+            [position_models.Keyword(
+                item = position_items[vendor_code],
+                item_name = f"Item {vendor_code}",
+                value = value
+            ) for value, vendor_code in self.keyword_pairs]
+        )
+        position_parsings = self.create_parsings(core_models.Parsing.Type.POSITION)
+        positions = []
+        for day, parsing_object in enumerate(position_parsings):
+            for keyword in self.keywords:
+                page, position = self.search_positions[(keyword.value, keyword.item.vendor_code)]
+                # товар постепенно поднимается в выдаче
+                position = max(1, position - day % 5)
+                positions.append(position_models.Position(
+                    keyword = keyword,
+                    parsing = parsing_object,
+                    city = self.city,
+                    page_capacities = [settings.DEFAULT_PAGE_CAPACITY] * page,
+                    page = page,
+                    position = position,
+                    sold_out = False
+                ))
+        position_models.Position.objects.bulk_create(positions, batch_size = 1000)
+
+
+@contextlib.contextmanager
+def serve(dataset: Dataset, latency: tuple[float, float]) -> Iterator[stand_in.StandInServer]:
+    """Запускает подменный сервер с ответами набора данных и направляет на него запросы парсинга."""
+
+    with tempfile.TemporaryDirectory() as folder:
+        store = stand_in.FixtureStore(f"{folder}/fixtures.sqlite3")
+        # порт выбирается системой
+        server = stand_in.StandInServer(("127.0.0.1", 0), store, latency, 0.0, None)
+        # server_close дожидается запросов, которые еще обрабатываются, до закрытия хранилища
+        server.daemon_threads = False
+        overridden = {
+            "CARD_BASE_URL": f"{server.url}/card",
+            "SEARCH_BASE_URL": f"{server.url}/search",
+            # подобранный размер части не должен переноситься между замерами и в настоящий парсинг
+            "CARD_ADAPTIVE_CHUNK_SIZE": False
+        }
+        old_settings = {x: getattr(parsing.settings, x) for x in overridden}
+        old_search_page_cache = parsing.search_page_cache
+        thread = threading.Thread(target = server.serve_forever, daemon = True)
+        thread.start()
+        try:
+            for name, value in overridden.items():
+                setattr(parsing.settings, name, value)
+            # кэш сделал бы повторные замеры бесплатными
+            parsing.search_page_cache = None
+            dataset.fill_store(store, parsing.settings.SEARCH_BASE_URL)
+            yield server
+        finally:
+            for name, value in old_settings.items():
+                setattr(parsing.settings, name, value)
+            parsing.search_page_cache = old_search_page_cache
+            server.shutdown()
+            server.server_close()
+            store.connection.close()
+
+
+def measure(name: str, function: Callable[[], Any], trace_memory: bool = True) -> BenchmarkResult:
+    """
+    Время и количество запросов к БД замеряются при одном запуске,
+    пиковая память - при втором, так как tracemalloc сильно замедляет выполнение.
+    """
+
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        function()
+        wall_time = time.perf_counter() - start
+
+    peak_memory = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            function()
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return BenchmarkResult(name, wall_time, len(queries), peak_memory)
+
+
+def get_hot_paths(dataset: Dataset) -> dict[str, Callable[[], Any]]:
+    items_categories = {x.vendor_code: x.category for x in dataset.price_items}
+    news = list(
+        price_models.Price.objects.filter(parsing = price_models.Price.objects.order_by("id").last().parsing)
+        .select_related("item__user")
+    ) if dataset.price_items else []
+
+    def parse_positions() -> None:
+        last_pages = position_models.Position.get_last_pages(dataset.keywords, dataset.city)
+        parsing.parse_positions(
+            [x.item.vendor_code for x in dataset.keywords],
+            [x.value for x in dataset.keywords],
+            dataset.dest,
+            [last_pages.get(x.id) for x in dataset.keywords]
+        )
+
+    return {
+        "parse_prices": lambda: parsing.parse_prices(dataset.vendor_codes, dataset.dest, items_categories),
+        "parse_positions": parse_positions,
+        "prepare_prices": lambda: price_models.PreparedPrice.prepare(dataset.price_items),
+        "prepare_positions": lambda: position_models.PreparedPosition.prepare(dataset.keywords),
+        "get_notifications": lambda: price_models.Price.get_notifications(news)
+    }
+
+
+def run_benchmarks(
+        scale: Scale,
+        names: list[str] = None,
+        latency: tuple[float, float] = None,
+        trace_memory: bool = True
+) -> list[BenchmarkResult]:
+    """Данные создаются в текущей БД, поэтому запускать нужно на тестовой (manage.py run_benchmarks)."""
+
+    if latency is None:
+        latency = settings.BENCHMARKS_LATENCY
+    dataset = Dataset(scale)
+    dataset.create()
+    results = []
+    with serve(dataset, latency):
+        for name, function in get_hot_paths(dataset).items():
+            if names is None or name in names:
+                results.append(measure(name, function, trace_memory))
+    return results
+
+
+def get_commit() -> str | None:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output = True,
+            text = True,
+            check = True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return commit
+
+
+def read_results(path: str = None) -> list[dict]:
+    if path is None:
+        path = settings.BENCHMARKS_RESULTS_PATH
+    if not Path(path).exists():
+        return []
+    with open(path, encoding = "utf-8") as file:
+        return [json.loads(x) for x in file if x.strip()]
+
+
+def save_results(scale: Scale, results: list[BenchmarkResult], path: str = None) -> dict:
+    """Результаты дописываются в файл, чтобы можно было сравнивать замеры разных коммитов."""
+
+    if path is None:
+        path = settings.BENCHMARKS_RESULTS_PATH
+    record = {
+        "commit": get_commit(),
+        "time": datetime.datetime.now().isoformat(timespec = "seconds"),
+        "scale": dataclasses.asdict(scale),
+        "results": [dataclasses.asdict(x) for x in results]
+    }
+    Path(path).parent.mkdir(parents = True, exist_ok = True)
+    with open(path, "a", encoding = "utf-8") as file:
+        file.write(json.dumps(record) + "\n")
+    return record
+
+
+def get_previous_results(scale: Scale, path: str = None) -> dict[str, dict]:
+    """Последние сохраненные результаты того же масштаба - {name: result}."""
+
+    previous = {}
+    for record in read_results(path):
+        if record["scale"] == dataclasses.asdict(scale):
+            previous.update({x["name"]: x for x in record["results"]})
+    return previous
+
+
+def format_results(results: list[BenchmarkResult], previous: dict[str, dict] = None) -> str:
+    if previous is None:
+        previous = {}
+    lines = [f"{'name':<20}{'time, s':>12}{'change':>10}{'queries':>10}{'peak, MB':>12}"]
+    for result in results:
+        if result.name in previous and previous[result.name]["wall_time"]:
+            change = f"{(result.wall_time / previous[result.name]['wall_time'] - 1) * 100:+.1f}%"
+        else:
+            change = "-"
+        if result.peak_memory is not None:
+            peak_memory = f"{result.peak_memory / 2 ** 20:.1f}"
+        else:
+            peak_memory = "-"
+        lines.append(f"{result.name:<20}{result.wall_time:>12.3f}{change:>10}{result.queries:>10}{peak_memory:>12}")
+    return "\n".join(lines)
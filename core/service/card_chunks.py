@@ -0,0 +1,145 @@
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, Self
+
+from core.service import file_lock
+from core.settings import Settings
+
+
+settings = Settings()
+
+Path(settings.PARSING_RESOURCES_PATH).mkdir(parents = True, exist_ok = True)
+CARD_CHUNK_SIZE_PATH = f"{settings.PARSING_RESOURCES_PATH}/card_chunk_size.json"
+
+
+class CardChunkSizer:
+    """
+    Подбирает наибольшее количество товаров в одном запросе к card.wb.ru и наибольшую длину URL.
+
+    Если за запуск был принят запрос текущего размера и ни один не был отвергнут,
+    следующий запуск пробует больший размер (но меньший, чем уже отвергнутый).
+    Размер уменьшается, только если сайт отверг часть (CARD_CHUNK_REJECT_STATUSES) или обрезал список товаров -
+    ошибки соединения и временные ошибки сайта на размер не влияют.
+    Отвергнутый размер забывается через CARD_CHUNK_CEILING_TTL.
+    Подобранные значения сохраняются между запусками.
+    """
+
+    def __init__(
+            self,
+            size: int,
+            floor: int,
+            ceiling: int | None,
+            max_url_length: int,
+            ceiling_time: float | None = None
+    ) -> None:
+        self.size = size
+        # наибольший размер, который точно принимается
+        self.floor = floor
+        # наименьший отвергнутый размер
+        self.ceiling = ceiling
+        # время, когда размер был отвергнут
+        self.ceiling_time = ceiling_time
+        self.max_url_length = max_url_length
+        self.failed = False
+        # наибольший принятый за запуск размер
+        self.accepted = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def read(cls) -> Self | None:
+        try:
+            with open(CARD_CHUNK_SIZE_PATH, 'r') as file:
+                data = json.load(file)
+            sizer = cls(data["size"], data["floor"], data["ceiling"], data["max_url_length"], data.get("ceiling_time"))
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            sizer = None
+        else:
+            if sizer.ceiling is not None and (
+                    sizer.ceiling_time is None or time.time() - sizer.ceiling_time > settings.CARD_CHUNK_CEILING_TTL
+            ):
+                sizer.ceiling = None
+                sizer.ceiling_time = None
+        return sizer
+
+    @classmethod
+    def load(cls) -> Self:
+        sizer = cls.read()
+        if sizer is None:
+            sizer = cls(settings.CARD_CHUNK_SIZE, 1, None, settings.CARD_MAX_URL_LENGTH)
+        return sizer
+
+    def update(self) -> None:
+        """Подбирает размер для следующего запуска по результатам текущего."""
+
+        if self.ceiling is None or self.accepted < self.ceiling:
+            self.floor = max(self.floor, self.accepted)
+
+        if self.failed and self.ceiling is not None:
+            self.floor = min(self.floor, self.ceiling - 1)
+            self.size = max(1, min(self.floor, self.ceiling - 1))
+        elif not self.failed and self.accepted >= self.size:
+            # увеличивается только размер, который действительно был принят
+            top = settings.CARD_CHUNK_SIZE_MAX if self.ceiling is None else self.ceiling - 1
+            self.size = max(self.size, min(top, self.size * 2 if self.ceiling is None else (self.size + top + 1) // 2))
+
+    def save(self) -> None:
+        self.update()
+        # чтение, объединение и запись под одной блокировкой - ограничения, найденные другими процессами, не теряются
+        with file_lock.locked(CARD_CHUNK_SIZE_PATH):
+            saved = self.read()
+            if saved is not None:
+                self.max_url_length = min(self.max_url_length, saved.max_url_length)
+                if saved.ceiling is not None and (self.ceiling is None or saved.ceiling < self.ceiling):
+                    self.ceiling = saved.ceiling
+                    self.ceiling_time = saved.ceiling_time
+                if self.ceiling is not None:
+                    self.floor = min(self.floor, self.ceiling - 1)
+                    self.size = max(1, min(self.size, self.ceiling - 1))
+            data = {
+                "size": self.size,
+                "floor": self.floor,
+                "ceiling": self.ceiling,
+                "ceiling_time": self.ceiling_time,
+                "max_url_length": self.max_url_length
+            }
+            file_lock.write_json(CARD_CHUNK_SIZE_PATH, data)
+
+    def get_chunks(self, vendor_codes: list[int], base_url_length: int) -> Iterator[list[int]]:
+        """
+        Делит артикулы на части, учитывая и количество товаров, и длину URL.
+
+        Части строятся по мере запроса, поэтому уменьшенный после отказа сайта размер
+        сразу применяется ко всем еще не отправленным частям.
+        """
+
+        chunk = []
+        url_length = base_url_length
+        for vendor_code in dict.fromkeys(vendor_codes):
+            # артикул и разделитель
+            vendor_code_length = len(str(vendor_code)) + 1
+            if chunk and (len(chunk) >= self.size or url_length + vendor_code_length > self.max_url_length):
+                yield chunk
+                chunk = []
+                url_length = base_url_length
+            chunk.append(vendor_code)
+            url_length += vendor_code_length
+        if chunk:
+            yield chunk
+
+    def accept(self, chunk_size: int) -> None:
+        with self.lock:
+            self.accepted = max(self.accepted, chunk_size)
+
+    def shrink(self, chunk_size: int, url_length: int, url_too_long: bool) -> None:
+        """Вызывается только когда часть отвергнута сайтом или список товаров в ответе обрезан."""
+
+        with self.lock:
+            self.failed = True
+            if url_too_long:
+                self.max_url_length = min(self.max_url_length, url_length - 1)
+            elif self.ceiling is None or chunk_size < self.ceiling:
+                self.ceiling = chunk_size
+                self.ceiling_time = time.time()
+                self.size = max(1, min(self.size, chunk_size // 2))
@@ -0,0 +1,137 @@
+from typing import Hashable, Iterable, Sequence
+
+import numpy
+
+
+# сдвиг номера предмета в составном ключе (номер предмета, финальная цена)
+CATEGORY_KEY_SHIFT = 2 ** 32
+NO_DISTANCE = numpy.iinfo(numpy.int64).max
+
+
+class NearestDiscounts:
+    """
+    Финальные цены товаров всех предметов с их СПП для пакетного поиска ближайшей цены.
+
+    Цены всех предметов лежат в одном отсортированном массиве составных ключей (номер предмета, финальная цена),
+    поэтому поиск для всей партии товаров выполняется одним numpy.searchsorted.
+    Товары без финальной цены или СПП отбрасываются один раз при построении.
+    При одинаковом расстоянии выбирается товар, стоящий позже в списке своего предмета.
+    """
+
+    def __init__(self, items_by_categories: dict[Hashable, Sequence]) -> None:
+        self.category_numbers: dict[Hashable, int] = {}
+        keys = []
+        numbers = []
+        discounts = []
+        starts = []
+        ends = []
+        for category_number, (category, items) in enumerate(items_by_categories.items()):
+            self.category_numbers[category] = category_number
+            # {final_price: (номер товара в items, personal_discount)}
+            by_final_price: dict[int, tuple[int, int]] = {}
+            for number, item in enumerate(items):
+                if item.final_price and item.personal_discount:
+                    by_final_price[item.final_price] = (number, item.personal_discount)
+            starts.append(len(keys))
+            for final_price in sorted(by_final_price):
+                keys.append(category_number * CATEGORY_KEY_SHIFT + final_price)
+                numbers.append(by_final_price[final_price][0])
+                discounts.append(by_final_price[final_price][1])
+            ends.append(len(keys))
+
+        self.keys = numpy.array(keys, dtype = numpy.int64)
+        self.numbers = numpy.array(numbers, dtype = numpy.int64)
+        self.discounts = numpy.array(discounts, dtype = numpy.float64)
+        # границы цен каждого предмета в keys
+        self.starts = numpy.array(starts, dtype = numpy.int64)
+        self.ends = numpy.array(ends, dtype = numpy.int64)
+
+    def get_nearest_discounts(self, categories: Iterable[Hashable], final_prices: Iterable[int]) -> numpy.ndarray:
+        """Возвращает СПП ближайших по финальной цене товаров того же предмета, nan - если таких товаров нет."""
+
+        category_numbers = numpy.array([self.category_numbers.get(x, -1) for x in categories], dtype = numpy.int64)
+        final_prices = numpy.fromiter(final_prices, dtype = numpy.int64, count = len(category_numbers))
+        nearest_discounts = numpy.full(len(category_numbers), numpy.nan)
+        known = category_numbers >= 0
+        if len(self.keys) == 0 or not known.any():
+            return nearest_discounts
+
+        category_numbers = category_numbers[known]
+        queries = category_numbers * CATEGORY_KEY_SHIFT + final_prices[known]
+        index = numpy.searchsorted(self.keys, queries, side = "left")
+        # ближайшие меньшая и не меньшая цены, только в пределах своего предмета
+        lower = index - 1
+        upper = index
+        lower_valid = lower >= self.starts[category_numbers]
+        upper_valid = upper < self.ends[category_numbers]
+        lower = numpy.clip(lower, 0, len(self.keys) - 1)
+        upper = numpy.clip(upper, 0, len(self.keys) - 1)
+        lower_distances = numpy.where(lower_valid, queries - self.keys[lower], NO_DISTANCE)
+        upper_distances = numpy.where(upper_valid, self.keys[upper] - queries, NO_DISTANCE)
+
+        take_upper = upper_valid & (
+                (upper_distances < lower_distances)
+                | ((upper_distances == lower_distances) & (self.numbers[upper] > self.numbers[lower]))
+        )
+        found = take_upper | lower_valid
+        nearest = numpy.where(take_upper, upper, lower)
+        nearest_discounts[known] = numpy.where(found, self.discounts[nearest], numpy.nan)
+        return nearest_discounts
+
+
+def get_prices(final_prices: numpy.ndarray, discounts: numpy.ndarray) -> numpy.ndarray:
+    """Цены до СПП по финальным ценам и СПП, nan - если СПП неизвестна."""
+
+    return numpy.round(final_prices / (100 - discounts) * 100)
+
+
+def get_supposed_discounts(
+        final_prices: Iterable[int | float],
+        discounts: dict[Hashable, dict[int, int | None]],
+        price_ranges: Sequence[tuple[int, int]]
+) -> dict[int | float, tuple[tuple[int, int], int]]:
+    """
+    Предполагаемые СПП по ценовым диапазонам - мода всех известных СПП диапазона,
+    а если мод несколько - верхняя медиана.
+    """
+
+    prices = numpy.array(list(list(discounts.values())[0].keys()), dtype = numpy.float64)
+    table = numpy.array(
+        [
+            [numpy.nan if x is None else x for x in category_discounts.values()]
+            for category_discounts in discounts.values()
+        ],
+        dtype = numpy.float64
+    ).reshape(len(discounts), len(prices))
+    range_uppers = numpy.array([x[1] for x in price_ranges], dtype = numpy.float64)
+
+    prices_ranges = numpy.searchsorted(range_uppers, prices, side = "right")
+    known = ~numpy.isnan(table)
+    values_ranges = numpy.broadcast_to(prices_ranges, table.shape)[known]
+    if (values_ranges >= len(price_ranges)).any():
+        raise IndexError("price is out of price ranges")
+    values = table[known]
+
+    modes_by_ranges = {}
+    for range_index in numpy.unique(values_ranges).tolist():
+        range_values = values[values_ranges == range_index]
+        unique_values, counts = numpy.unique(range_values, return_counts = True)
+        modes = unique_values[counts == counts.max()]
+        if len(modes) == 1:
+            mode = modes[0]
+        else:
+            # statistics.median_high
+            mode = numpy.sort(range_values)[len(range_values) // 2]
+        modes_by_ranges[price_ranges[range_index]] = int(mode)
+
+    final_prices = list(final_prices)
+    final_prices_ranges = numpy.searchsorted(
+        range_uppers,
+        numpy.array(final_prices, dtype = numpy.float64),
+        side = "right"
+    )
+    supposed_discounts = {}
+    for final_price, range_index in zip(final_prices, final_prices_ranges.tolist()):
+        price_range = price_ranges[range_index]
+        supposed_discounts[final_price] = (price_range, modes_by_ranges[price_range])
+    return supposed_discounts
@@ -0,0 +1,63 @@
+import contextlib
+import json
+import os
+import threading
+from typing import Any, Iterator
+
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# файловая блокировка не всегда разделяет потоки одного процесса
+# {путь: блокировка потоков}
+thread_locks: dict[str, threading.Lock] = {}
+thread_locks_lock = threading.Lock()
+
+
+def lock_file(descriptor: int) -> None:
+    os.lseek(descriptor, 0, os.SEEK_SET)
+    if os.name == "nt":
+        msvcrt.locking(descriptor, msvcrt.LK_LOCK, 1)
+    else:
+        fcntl.flock(descriptor, fcntl.LOCK_EX)
+
+
+def unlock_file(descriptor: int) -> None:
+    os.lseek(descriptor, 0, os.SEEK_SET)
+    if os.name == "nt":
+        msvcrt.locking(descriptor, msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(descriptor, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def locked(path: str) -> Iterator[None]:
+    """
+    Блокировка path для всех потоков и процессов парсера.
+
+    Блокируется отдельный файл path.lock, так как сам path заменяется при записи.
+    """
+
+    with thread_locks_lock:
+        thread_lock = thread_locks.setdefault(path, threading.Lock())
+    with thread_lock:
+        descriptor = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+        try:
+            lock_file(descriptor)
+            try:
+                yield
+            finally:
+                unlock_file(descriptor)
+        finally:
+            os.close(descriptor)
+
+
+def write_json(path: str, data: Any) -> None:
+    """Запись через временный файл, чтобы параллельные процессы не прочитали файл частично."""
+
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary_path, 'w') as file:
+        json.dump(data, file)
+    os.replace(temporary_path, path)
@@ -0,0 +1,125 @@
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests import RequestException
+from requests.adapters import HTTPAdapter
+
+from core.service import rate_limiter, resilience, stand_in
+from core.settings import Settings
+
+
+settings = Settings()
+
+
+class HttpClient:
+    """
+    Клиент с пулами постоянных соединений (отдельный пул на каждый хост) и общей политикой повторов.
+
+    Повторы выполняются с экспоненциальной задержкой в пределах бюджета повторов хоста,
+    а хост, возвращающий ошибки подряд, на время перестает запрашиваться (CircuitOpenError).
+    """
+
+    def __init__(self) -> None:
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections = settings.HTTP_POOL_CONNECTIONS,
+            pool_maxsize = settings.HTTP_POOL_MAX_SIZE
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.rate_limiter = rate_limiter.RateLimiter() if settings.RATE_LIMITER_ENABLED else None
+        self.host_guard = resilience.HostGuard()
+        self.recorder = stand_in.Recorder() if settings.STAND_IN_RECORD else None
+
+    @staticmethod
+    def get_retry_delay(attempt: int, response: requests.Response | None) -> float:
+        delay = resilience.get_backoff_delay(attempt)
+        if response is not None and (retry_after := response.headers.get("Retry-After", "")).isdigit():
+            delay = max(delay, min(int(retry_after), settings.HTTP_RETRY_BACKOFF_MAX))
+        return delay
+
+    def report_success(self, url: str) -> None:
+        """Для ответов, запрошенных с confirm_success, после того как вызывающий код их разобрал."""
+
+        self.host_guard.get_breaker(urlsplit(url).hostname).record_success()
+
+    def report_failure(self, url: str) -> None:
+        """Для ответов, которые пришли успешно, но не могут быть использованы (например, не разбираются)."""
+
+        self.host_guard.get_breaker(urlsplit(url).hostname).record_failure()
+
+    def get(
+            self,
+            url: str,
+            params: dict = None,
+            headers: dict = None,
+            timeout: tuple[float, float] = None,
+            retries_amount: int = None,
+            confirm_success: bool = False
+    ) -> requests.Response:
+        """
+        Если confirm_success, ответ со статусом 200 не засчитывается хосту как успешный -
+        вызывающий код сообщает результат разбора через report_success или report_failure,
+        иначе ответы, которые не разбираются, сбрасывали бы счетчик ошибок предохранителя.
+        """
+
+        if timeout is None:
+            timeout = settings.HTTP_TIMEOUT
+        if retries_amount is None:
+            retries_amount = settings.HTTP_RETRIES_AMOUNT
+        host = urlsplit(url).hostname
+        breaker = self.host_guard.get_breaker(host)
+        budget = self.host_guard.get_budget(host)
+        budget.deposit()
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise resilience.CircuitOpenError(f"{host} is not requested after a series of failures")
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(host)
+
+            response = None
+            error = None
+            try:
+                response = self.session.get(url, params = params, headers = headers, timeout = timeout)
+            except RequestException as exception:
+                error = exception
+            if error is None and response.status_code not in settings.HTTP_RETRY_STATUSES:
+                if not confirm_success or response.status_code != 200:
+                    breaker.record_success()
+                if self.recorder is not None:
+                    self.recorder.record(url, params, response)
+                return response
+
+            breaker.record_failure()
+            attempt += 1
+            if attempt > retries_amount or not budget.withdraw():
+                if error is not None:
+                    raise error
+                # ответ с ошибочным статусом возвращается вызывающему коду, а не превращается в исключение
+                return response
+            time.sleep(self.get_retry_delay(attempt, response))
+
+
+client = HttpClient()
+
+
+def get(
+        url: str,
+        params: dict = None,
+        headers: dict = None,
+        timeout: tuple[float, float] = None,
+        retries_amount: int = None,
+        confirm_success: bool = False
+) -> requests.Response:
+    return client.get(url, params, headers, timeout, retries_amount, confirm_success)
+
+
+def report_success(url: str) -> None:
+    client.report_success(url)
+
+
+def report_failure(url: str) -> None:
+    client.report_failure(url)
@@ -0,0 +1,83 @@
+import dataclasses
+import json
+from typing import Any, Self
+
+from core.settings import Settings
+
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+settings = Settings()
+
+# ошибка разбора любым декодером - orjson.JSONDecodeError и requests.JSONDecodeError наследуются от нее
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(content: bytes | str) -> Any:
+    if settings.JSON_DECODER == "orjson" and orjson is not None:
+        data = orjson.loads(content)
+    else:
+        data = json.loads(content)
+    return data
+
+
+@dataclasses.dataclass(slots = True)
+class CardProduct:
+    """Только те поля товара из ответа card.wb.ru, которые нужны парсеру."""
+
+    final_price: int
+    sold_out: bool
+    reviews_amount: int
+    name_site: str
+
+    @classmethod
+    def from_dict(cls, product: dict) -> Self:
+        sold_out = True
+        for size in product["sizes"]:
+            if len(size["stocks"]) > 0:
+                sold_out = False
+                break
+        return cls(
+            round(int(product["salePriceU"]) / 100),
+            sold_out,
+            int(product["feedbacks"]),
+            f"{product['brand']} / {product['name']}"
+        )
+
+
+def decode_card_products(content: bytes) -> dict[int, CardProduct | Exception]:
+    """
+    Возвращает товары ответа card.wb.ru в порядке ответа.
+
+    Ошибка разбора отдельного товара возвращается вместо него, чтобы не терять остальные товары ответа.
+    """
+
+    products = {}
+    for product in loads(content)["data"]["products"]:
+        vendor_code = product["id"]
+        try:
+            products[vendor_code] = CardProduct.from_dict(product)
+        except Exception as error:
+            products[vendor_code] = error
+    return products
+
+
+def decode_search_products(content: bytes) -> tuple[list[int], dict[int, int], bool]:
+    """
+    Возвращает артикулы страницы поисковой выдачи, рекламные позиции ({vendor_code: log_position})
+    и признак того, что страницы закончились и дальше идет другая выдача.
+    """
+
+    response_json = loads(content)
+    products = response_json["data"]["products"]
+    if "original" in response_json["metadata"]:
+        return [], {}, True
+    return (
+        [x["id"] for x in products],
+        {x["id"]: x["log"]["position"] for x in products if "log" in x and len(x["log"])},
+        False
+    )
@@ -1,13 +1,17 @@
+import copy
 import dataclasses
-import json
+import itertools
+import math
 import time
-from collections import Counter, defaultdict
-from pathlib import Path
-from typing import Iterable
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from typing import Iterable, Iterator, Self
 
+import numpy
 import requests
-from requests import JSONDecodeError
+from requests import RequestException
 
+from core.service import baskets, card_chunks, discounts, http_client, json_decoding, resilience, search_cache
 from core.settings import Settings
 from logger import Logger
 from parser_price import models as price_models
@@ -16,12 +20,10 @@ from parser_seller_api import models as seller_api_models
 
 settings = Settings()
 logger = Logger(f"{settings.APP_NAME}_service")
+search_page_cache = search_cache.SearchPageCache() if settings.SEARCH_CACHE_ENABLED else None
 
-Path(settings.PARSING_RESOURCES_PATH).mkdir(parents = True, exist_ok = True)
-BASKETS_PATH = f"{settings.PARSING_RESOURCES_PATH}/temp_basket_entities.json"
 
-
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen = True, slots = True)
 class ParsedPrice:
     price: int | None
     personal_discount: int | None
@@ -32,7 +34,7 @@ class ParsedPrice:
     name_site: str | None
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen = True, slots = True)
 class ParsedPosition:
     page_capacities: list[str] | None
     page: int | None
@@ -42,6 +44,226 @@ class ParsedPosition:
     sold_out: int | None = None
 
 
+@dataclasses.dataclass(frozen = True, slots = True)
+class SearchPage:
+    vendor_codes: list[int]
+    # {vendor_code: позиция в выдаче без рекламы (log.position)}
+    logs: dict[int, int]
+    # страницы закончились, дальше идет другая выдача
+    last: bool
+
+
+def get_items_url(vendor_codes_chunk: list[int], dest: str) -> str:
+    # если указать СПП меньше реальной, придут неверные данные, при СПП >= 100 данные не приходят
+    request_personal_discount = 99
+    return (f"{settings.CARD_BASE_URL}/cards/detail?appType=1&curr=rub"
+            f"&dest={dest}&spp={request_personal_discount}"
+            f"&nm={';'.join(str(x) for x in vendor_codes_chunk)}")
+
+
+def get_missing_tail(vendor_codes_chunk: list[int], returned_vendor_codes: Iterable[int]) -> list[int]:
+    """Артикулы после последнего вернувшегося товара - если ответ был обрезан, то это они."""
+
+    indexes = {x: index for index, x in enumerate(vendor_codes_chunk)}
+    returned = [indexes[x] for x in returned_vendor_codes if x in indexes]
+    if returned:
+        tail = vendor_codes_chunk[max(returned) + 1:]
+    else:
+        tail = []
+    return tail
+
+
+def fetch_items_chunk(
+        vendor_codes_chunk: list[int],
+        dest: str,
+        chunk_sizer: card_chunks.CardChunkSizer = None
+) -> dict[int, json_decoding.CardProduct | Exception]:
+    url = get_items_url(vendor_codes_chunk, dest)
+    items_response = None
+    try:
+        for attempt in range(1, settings.CARD_CHUNK_ATTEMPTS_AMOUNT + 1):
+            items_response = http_client.get(url, confirm_success = True)
+            try:
+                products = json_decoding.decode_card_products(items_response.content)
+                http_client.report_success(url)
+                break
+            except (ValueError, KeyError):
+                if items_response.status_code != 200:
+                    raise
+                # сайт ответил, но не данными - запрос повторяется
+                http_client.report_failure(url)
+                if attempt == settings.CARD_CHUNK_ATTEMPTS_AMOUNT:
+                    raise
+                time.sleep(resilience.get_backoff_delay(attempt))
+    except resilience.CircuitOpenError:
+        # хост недоступен, размер части тут ни при чем
+        raise
+    except (RequestException, ValueError, KeyError) as error:
+        # ошибки соединения и временные ошибки уже повторены клиентом - делится только часть, отвергнутая сайтом,
+        # поэтому количество дополнительных запросов ограничено глубиной деления
+        rejected = items_response is not None and items_response.status_code in settings.CARD_CHUNK_REJECT_STATUSES
+        if chunk_sizer is None or len(vendor_codes_chunk) <= 1 or not rejected:
+            raise error
+        # запрос отвергнут из-за размера - части запрашиваются отдельно
+        chunk_sizer.shrink(len(vendor_codes_chunk), len(url), items_response.status_code == 414)
+        middle = len(vendor_codes_chunk) // 2
+        products = fetch_items_chunk(vendor_codes_chunk[:middle], dest, chunk_sizer)
+        products.update(fetch_items_chunk(vendor_codes_chunk[middle:], dest, chunk_sizer))
+        return products
+
+    if chunk_sizer is not None and (tail := get_missing_tail(vendor_codes_chunk, products)):
+        tail_products = fetch_items_chunk(tail, dest, chunk_sizer)
+        # если в конце списка нашлись товары, то ответ действительно был обрезан
+        if tail_products:
+            chunk_sizer.shrink(len(vendor_codes_chunk), len(url), False)
+        else:
+            chunk_sizer.accept(len(vendor_codes_chunk))
+        products.update(tail_products)
+    elif chunk_sizer is not None:
+        chunk_sizer.accept(len(vendor_codes_chunk))
+    return products
+
+
+def fetch_items_chunks(
+        chunks: Iterable[list[int]],
+        dest: str,
+        chunk_sizer: card_chunks.CardChunkSizer = None
+) -> Iterator[tuple[list[int], dict[int, json_decoding.CardProduct | Exception], Exception | None]]:
+    """
+    Запрашивает части параллельно и отдает их по мере получения.
+
+    Одновременно в работе не больше двух частей на поток, чтобы полученные, но еще не обработанные ответы
+    не накапливались в памяти. Следующая часть берется из chunks только после получения предыдущей,
+    поэтому ленивые chunks учитывают уменьшение размера.
+    """
+
+    chunks = iter(chunks)
+    with ThreadPoolExecutor(settings.CARD_REQUESTS_MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(fetch_items_chunk, chunk, dest, chunk_sizer): chunk
+            for chunk in itertools.islice(chunks, settings.CARD_REQUESTS_MAX_WORKERS * 2)
+        }
+        while futures:
+            done, _ = wait(futures, return_when = FIRST_COMPLETED)
+            for future in done:
+                chunk = futures.pop(future)
+                if (next_chunk := next(chunks, None)) is not None:
+                    futures[executor.submit(fetch_items_chunk, next_chunk, dest, chunk_sizer)] = next_chunk
+                try:
+                    products = future.result()
+                    error = None
+                except Exception as exception:
+                    products = {}
+                    error = exception
+                yield chunk, products, error
+
+
+@dataclasses.dataclass
+class PricesState:
+    """
+    Данные парсинга цен, которые не меняются от части к части работы -
+    процесс движка запуска загружает их один раз, а не для каждой части.
+    """
+
+    seller_api_items: dict[int, seller_api_models.Item]
+    nearest_discounts: discounts.NearestDiscounts
+    chunk_sizer: card_chunks.CardChunkSizer | None
+    basket_resolver: baskets.BasketResolver
+
+    @classmethod
+    def load(cls, seller_api_items: dict[int, seller_api_models.Item] = None) -> Self:
+        if seller_api_items is None:
+            seller_api_items = {
+                x.vendor_code: x for x in seller_api_models.Item.objects.all().prefetch_related("category")
+            }
+        seller_api_items_by_category = defaultdict(list)
+        for item in seller_api_items.values():
+            seller_api_items_by_category[item.category].append(item)
+        nearest_discounts = discounts.NearestDiscounts(
+            {key: sorted(value, key = lambda x: x.real_price) for key, value in seller_api_items_by_category.items()}
+        )
+        chunk_sizer = card_chunks.CardChunkSizer.load() if settings.CARD_ADAPTIVE_CHUNK_SIZE else None
+        return cls(seller_api_items, nearest_discounts, chunk_sizer, baskets.BasketResolver.load())
+
+    def save(self) -> None:
+        if self.chunk_sizer is not None:
+            # сохраняется копия - размер для следующего запуска не должен применяться к оставшимся частям текущего
+            copy.copy(self.chunk_sizer).save()
+        self.basket_resolver.save()
+
+
+def iterate_prices(
+        vendor_codes: list[int],
+        dest: str,
+        items_categories: dict[int, price_models.Category] = None,
+        parse_categories = True,
+        seller_api_items: dict[int, seller_api_models.Item] = None,
+        batch_size: int = None,
+        state: PricesState = None
+) -> Iterator[tuple[dict[int, ParsedPrice], dict[int, Exception]]]:
+    """
+    Отдает цены и ошибки партиями примерно по batch_size товаров по мере получения ответов card.wb.ru.
+
+    Переданное состояние сохраняет вызывающий код, загруженное здесь - сохраняется здесь.
+    """
+
+    if batch_size is None:
+        batch_size = settings.PRICE_BATCH_SIZE
+    own_state = state is None
+    if own_state:
+        state = PricesState.load(seller_api_items)
+    seller_api_items = state.seller_api_items
+    nearest_discounts = state.nearest_discounts
+    chunk_sizer = state.chunk_sizer
+    if chunk_sizer is not None:
+        chunks = chunk_sizer.get_chunks(vendor_codes, len(get_items_url([], dest)))
+    else:
+        chunk_size = settings.CARD_CHUNK_SIZE
+        chunks = [vendor_codes[x: x + chunk_size] for x in range(0, len(vendor_codes), chunk_size)]
+
+    batch_vendor_codes = []
+    products = {}
+    errors = {}
+    try:
+        for vendor_codes_chunk, chunk_products, chunk_error in fetch_items_chunks(chunks, dest, chunk_sizer):
+            batch_vendor_codes.extend(vendor_codes_chunk)
+            if chunk_error is not None:
+                errors.update({x: chunk_error for x in vendor_codes_chunk})
+            else:
+                products.update(chunk_products)
+
+            if len(batch_vendor_codes) >= batch_size:
+                yield parse_prices_batch(
+                    batch_vendor_codes,
+                    products,
+                    errors,
+                    items_categories,
+                    parse_categories,
+                    seller_api_items,
+                    nearest_discounts,
+                    state.basket_resolver
+                )
+                batch_vendor_codes = []
+                products = {}
+                errors = {}
+    finally:
+        # подобранный размер части сохраняется, даже если парсинг прерван
+        if own_state:
+            state.save()
+
+    if batch_vendor_codes:
+        yield parse_prices_batch(
+            batch_vendor_codes,
+            products,
+            errors,
+            items_categories,
+            parse_categories,
+            seller_api_items,
+            nearest_discounts,
+            state.basket_resolver
+        )
+
+
 def parse_prices(
         vendor_codes: list[int],
         dest: str,
@@ -49,236 +271,450 @@ def parse_prices(
         parse_categories = True,
         seller_api_items: dict[int, seller_api_models.Item] = None
 ) -> tuple[dict[int, ParsedPrice], dict[int, Exception]]:
-    # если указать СПП меньше реальной, придут неверные данные, при СПП >= 100 данные не приходят
-    request_personal_discount = 99
-    # todo: проверить, может быть можно делать запросы с большим, чем 100, chunk_size
-    chunk_size = 100
-    chunks = [vendor_codes[x: x + chunk_size] for x in range(0, len(vendor_codes), chunk_size)]
     prices = {}
     errors = {}
-    if seller_api_items is None:
-        seller_api_items: dict[int, seller_api_models.Item] = {
-            x.vendor_code: x for x in seller_api_models.Item.objects.all().prefetch_related("category")
-        }
-    seller_api_items_by_category = defaultdict(list)
-    for item in seller_api_items.values():
-        seller_api_items_by_category[item.category].append(item)
-    seller_api_items_by_category = {key: sorted(value, key = lambda x: x.real_price)
-                                    for key, value in seller_api_items_by_category.items()}
+    for batch_prices, batch_errors in iterate_prices(
+            vendor_codes,
+            dest,
+            items_categories,
+            parse_categories,
+            seller_api_items
+    ):
+        prices.update(batch_prices)
+        errors.update(batch_errors)
+    return prices, errors
 
+
+def parse_prices_batch(
+        vendor_codes: list[int],
+        products: dict[int, json_decoding.CardProduct | Exception],
+        errors: dict[int, Exception],
+        items_categories: dict[int, price_models.Category] | None,
+        parse_categories: bool,
+        seller_api_items: dict[int, seller_api_models.Item],
+        nearest_discounts: discounts.NearestDiscounts,
+        basket_resolver: baskets.BasketResolver = None
+) -> tuple[dict[int, ParsedPrice], dict[int, Exception]]:
+    """Разбирает ответы card.wb.ru для одной партии товаров."""
+
+    prices = {}
     if parse_categories:
-        try:
-            with open(BASKETS_PATH, 'r') as file:
-                baskets = json.load(file)
-                if baskets[0] == "":
-                    baskets = []
-        except FileNotFoundError:
-            baskets = []
-        baskets_order = get_baskets_order(baskets)
+        # категории не запрашиваются для товаров, ответ по которым не удалось разобрать
+        categories, categories_errors = get_categories(
+            [x for x, y in products.items() if x not in errors and not isinstance(y, Exception)],
+            items_categories,
+            basket_resolver
+        )
+        errors.update(categories_errors)
     else:
-        baskets_order = None
+        categories = {}
 
-    for vendor_codes_chunk in chunks:
-        # todo: сделать запросы асинхронными (ThreadPoolExecutor)
-        url = (f"https://card.wb.ru/cards/detail?appType=1&curr=rub"
-               f"&dest={dest}&spp={request_personal_discount}"
-               f"&nm={';'.join(str(x) for x in vendor_codes_chunk)}")
-        items_response = requests.get(url)
+    # товары, СПП которых оценивается по ближайшим ценам товаров продавца того же предмета
+    estimated_vendor_codes = []
+    for vendor_code in vendor_codes:
+        if vendor_code in errors:
+            continue
+        try:
+            product = products[vendor_code]
+            if isinstance(product, Exception):
+                raise product
+            final_price = product.final_price
+            category = categories.get(vendor_code)
+
+            if vendor_code in seller_api_items:
+                seller_api_item = seller_api_items[vendor_code]
+                price = seller_api_item.real_price
+                personal_discount = round((1 - final_price / price) * 100)
+            else:
+                price = None
+                personal_discount = None
+                estimated_vendor_codes.append(vendor_code)
+
+            prices[vendor_code] = ParsedPrice(
+                price,
+                personal_discount,
+                final_price,
+                product.sold_out,
+                product.reviews_amount,
+                category,
+                product.name_site
+            )
+        except Exception as error:
+            errors[vendor_code] = error
 
-        item_dicts = {x["id"]: x for x in items_response.json()["data"]["products"]}
-        for vendor_code in vendor_codes_chunk:
-            try:
-                item_dict: dict = item_dicts[vendor_code]
-                final_price, sold_out = get_price(item_dict)
-                reviews_amount = int(item_dict["feedbacks"])
-                name_site = f"{item_dict['brand']} / {item_dict['name']}"
-
-                if parse_categories:
-                    if items_categories is not None and vendor_code in items_categories:
-                        category = items_categories[vendor_code]
-                    else:
-                        category_name, basket = get_category_name(baskets_order, vendor_code)
-                        baskets.append(basket)
-                        category = price_models.Category.objects.get_or_create(name = category_name)[0]
-                else:
-                    category = None
-
-                if vendor_code in seller_api_items:
-                    seller_api_item = seller_api_items[vendor_code]
-                    price = seller_api_item.real_price
-                    personal_discount = round((1 - final_price / price) * 100)
-                elif category in seller_api_items_by_category:
-                    personal_discount, price = get_nearest_personal_discount(
-                        seller_api_items_by_category[category],
-                        final_price
-                    )
-                else:
-                    price = None
-                    personal_discount = None
-
-                prices[vendor_code] = ParsedPrice(
-                    price,
-                    personal_discount,
-                    final_price,
-                    sold_out,
-                    reviews_amount,
-                    category,
-                    name_site
+    if estimated_vendor_codes:
+        final_prices = numpy.array([prices[x].final_price for x in estimated_vendor_codes], dtype = numpy.int64)
+        estimated_discounts = nearest_discounts.get_nearest_discounts(
+            [prices[x].category for x in estimated_vendor_codes],
+            final_prices
+        )
+        estimated_prices = discounts.get_prices(final_prices, estimated_discounts)
+        for vendor_code, personal_discount, price in zip(
+                estimated_vendor_codes,
+                estimated_discounts.tolist(),
+                estimated_prices.tolist()
+        ):
+            if not math.isnan(personal_discount):
+                prices[vendor_code] = dataclasses.replace(
+                    prices[vendor_code],
+                    price = int(price),
+                    personal_discount = int(personal_discount)
                 )
-            except Exception as error:
-                errors[vendor_code] = error
-
-    if parse_categories:
-        entities_threshold = 10000
-        if len(baskets) > entities_threshold:
-            left = len(baskets) - entities_threshold
-        else:
-            left = 0
-        with open(BASKETS_PATH, 'w') as file:
-            json.dump(baskets[left:], file)
 
     return prices, errors
 
 
-def get_nearest_personal_discount(
-        items: list[seller_api_models.Item],
-        final_price: int
-) -> tuple[int | None, int | None]:
-    if len(items) == 0:
-        nearest_discount = None
-        price = None
+def get_categories(
+        vendor_codes: list[int],
+        items_categories: dict[int, price_models.Category] = None,
+        basket_resolver: baskets.BasketResolver = None
+) -> tuple[dict[int, price_models.Category], dict[int, Exception]]:
+    """
+    Предметы берутся из переданных, затем из сохраненных в БД и только недостающие запрашиваются с сайта.
+    Переданный basket_resolver сохраняет вызывающий код.
+    """
+
+    if items_categories is None:
+        items_categories = {}
+    categories = {x: items_categories[x] for x in vendor_codes if items_categories.get(x) is not None}
+    categories.update(
+        price_models.CachedCategory.get_categories([x for x in vendor_codes if x not in categories])
+    )
+
+    misses = [x for x in vendor_codes if x not in categories]
+    errors = {}
+    if misses:
+        category_names = {}
+        own_resolver = basket_resolver is None
+        if own_resolver:
+            basket_resolver = baskets.BasketResolver.load()
+        with ThreadPoolExecutor(settings.BASKETS_REQUESTS_MAX_WORKERS) as executor:
+            futures = {executor.submit(get_category_name, basket_resolver, x): x for x in misses}
+            for future in as_completed(futures):
+                vendor_code = futures[future]
+                try:
+                    category_names[vendor_code], _ = future.result()
+                except Exception as error:
+                    errors[vendor_code] = error
+        if own_resolver:
+            basket_resolver.save()
+
+        categories_by_names = price_models.Category.get_or_create_categories(category_names.values())
+        categories.update({x: categories_by_names[name] for x, name in category_names.items()})
+        # предмет не найден - в следующий раз нужно попробовать снова
+        price_models.CachedCategory.update_categories(
+            {x: categories_by_names[name] for x, name in category_names.items() if name}
+        )
+    return categories, errors
+
+
+def request_card(basket: int, vol: int, part: int, vendor_code: int, retries_amount: int = None) -> requests.Response:
+    url = (f"{settings.BASKET_BASE_URL.format(basket = str(basket).rjust(2, '0'))}/vol{vol}"
+           f"/part{part}/{vendor_code}/info/ru/card.json")
+    return http_client.get(url, retries_amount = retries_amount)
+
+
+def race_baskets(
+        baskets_group: list[int],
+        vol: int,
+        part: int,
+        vendor_code: int
+) -> tuple[int | None, dict | None, Exception | None]:
+    """
+    Запрашивает карточку у нескольких хостов одновременно и возвращает первый успешный ответ.
+
+    Проигравшие запросы продолжают выполняться после возврата, поэтому в гонке они не повторяются -
+    иначе они бы тратили бюджет повторов и токены ограничителя частоты basket.
+    Единственный хост запрашивается с обычными повторами.
+    """
+
+    basket = None
+    card = None
+    error = None
+    retries_amount = settings.BASKETS_RACE_RETRIES_AMOUNT if len(baskets_group) > 1 else None
+    executor = ThreadPoolExecutor(len(baskets_group))
+    try:
+        futures = {
+            executor.submit(request_card, x, vol, part, vendor_code, retries_amount): x for x in baskets_group
+        }
+        for future in as_completed(futures):
+            try:
+                response = future.result()
+            except RequestException as exception:
+                error = exception
+                continue
+            if response.status_code == 200:
+                basket = futures[future]
+                card = json_decoding.loads(response.content)
+                break
+    finally:
+        # уже отправленные запросы не прерываются, но их ответы не ожидаются
+        executor.shutdown(wait = False, cancel_futures = True)
+    return basket, card, error
+
+
+def get_category_name(basket_resolver: baskets.BasketResolver, vendor_code: int) -> tuple[str, int | None]:
+    part = vendor_code // 1000
+    vol = part // 100
+    candidates, known = basket_resolver.get_candidates(vol)
+    width = settings.BASKETS_RACE_WIDTH
+    if known:
+        # хост уже известен, поэтому сначала запрашивается только он
+        groups = [candidates[:1]]
+        candidates = candidates[1:]
     else:
-        differences = {abs(final_price - item.final_price): item for item in items
-                       if item.final_price and item.personal_discount}
-        if differences:
-            nearest_item = differences[min(differences)]
-            nearest_discount = nearest_item.personal_discount
-            price = round(final_price / (100 - nearest_discount) * 100)
-        else:
-            nearest_discount = None
-            price = None
-
-    return nearest_discount, price
+        groups = []
+    groups.extend(candidates[x:x + width] for x in range(0, len(candidates), width))
+
+    errors = []
+    for group in groups:
+        basket, card, error = race_baskets(group, vol, part, vendor_code)
+        if basket is not None:
+            category_name = card["subj_name"]
+            basket_resolver.learn(vol, basket)
+            break
+        if error is not None:
+            errors.append(error)
+    else:
+        if errors:
+            raise errors[0]
+        category_name = ""
+        basket = None
+    return category_name, basket
 
 
-def get_price(item_dict: dict) -> tuple[int, bool]:
-    sold_out = True
-    for size in item_dict["sizes"]:
-        if len(size["stocks"]) > 0:
-            sold_out = False
-            break
-    final_price = round(int(item_dict["salePriceU"]) / 100)
-    return final_price, sold_out
+def get_search_url(keyword: str, dest: str, page: int, sort: str = "popular") -> str:
+    # noinspection SpellCheckingInspection
+    return (f"{settings.SEARCH_BASE_URL}/exactmatch/ru/common/v4/search?appType=1&curr=rub&dest={dest}&page={page}"
+            f"&query={keyword}&resultset=catalog&sort={sort}&spp=0&suppressSpellcheck=false")
 
 
-def get_baskets_order(baskets: Iterable[int]) -> tuple[int, ...]:
-    basket_weights = Counter(map(int, baskets))
-    for i in range(1, 50):
-        if i not in basket_weights:
-            basket_weights[i] = 0
-    return tuple(key for key, value in sorted(basket_weights.items(), key = lambda item: -item[1]))
+def fetch_search_page(keyword: str, dest: str, page: int, sort: str = "popular") -> SearchPage | None:
+    """Возвращает None, если страницу не удалось получить."""
 
+    if search_page_cache is not None:
+        cached_page = search_page_cache.get(keyword, dest, page, sort)
+        if cached_page is not None:
+            return SearchPage(*cached_page)
 
-# todo: переписать это, чтобы basket получался, а не угадывался
-def get_category_name(baskets_order: Iterable[int], vendor_code: int) -> tuple[str, int]:
-    part = vendor_code // 1000
-    vol = part // 100
-    for basket in baskets_order:
-        # todo: сделать запросы асинхронными (ThreadPoolExecutor)?
-        category_url = (f"https://basket-{str(basket).rjust(2, '0')}.wb.ru/vol{vol}"
-                        f"/part{part}/{vendor_code}/info/ru/card.json")
-        category_response = requests.get(category_url)
-        if category_response.status_code == 200:
-            category_name = category_response.json()["subj_name"]
+    url = get_search_url(keyword, dest, page, sort)
+    search_page = None
+    for try_number in range(1, settings.REQUEST_PAGE_ITEMS_ATTEMPTS_AMOUNT + 1):
+        try:
+            search_page = SearchPage(
+                *json_decoding.decode_search_products(http_client.get(url, confirm_success = True).content)
+            )
+        except json_decoding.JSONDecodeError:
+            search_page = None
+            http_client.report_failure(url)
+            if try_number < settings.REQUEST_PAGE_ITEMS_ATTEMPTS_AMOUNT:
+                # еще одна попытка
+                time.sleep(resilience.get_backoff_delay(try_number))
+            continue
+        except KeyError:
+            # ответ разобран, но это не выдача
+            http_client.report_failure(url)
+            raise
+        http_client.report_success(url)
+
+        if search_page.last:
+            # страницы закончились, теперь идет другая выдача
+            break
+        # неполная страница запрашивается повторно
+        if len(search_page.vendor_codes) == settings.DEFAULT_PAGE_CAPACITY:
             break
-    else:
-        category_name = ""
-    # noinspection PyUnboundLocalVariable
-    return category_name, basket
-
 
-# не использовать на прямую, так как нет проверки на наличие товара
-def parse_position(vendor_code: int, keyword: str, dest: str) -> ParsedPosition:
-    try:
-        page = 1
-        position = None
+    if search_page_cache is not None and search_page is not None:
+        search_page_cache.put(
+            keyword,
+            dest,
+            page,
+            sort,
+            (search_page.vendor_codes, search_page.logs, search_page.last)
+        )
+    return search_page
+
+
+def get_parsed_position(
+        vendor_code: int,
+        search_page: SearchPage,
+        page: int,
+        page_capacities: list[int]
+) -> ParsedPosition:
+    position = search_page.vendor_codes.index(vendor_code) + 1
+    if vendor_code in search_page.logs:
+        promo_page = page
+        promo_position = position
+        # предполагается, что емкость каждой страницы совпадает с емкостью первой
+        page = search_page.logs[vendor_code] // page_capacities[0] + 1
+        position = search_page.logs[vendor_code] % page_capacities[0] + 1
+    else:
         promo_page = None
         promo_position = None
-        page_capacities = []
-        while page:
-            # todo: сделать запросы асинхронными (ThreadPoolExecutor)
-            # todo: можно ускорить, если искать по одному ключевому запросу сразу несколько товаров
-            # noinspection SpellCheckingInspection
-            url = (f"https://search.wb.ru/exactmatch/ru/common/v4/search?appType=1&curr=rub&dest={dest}&page={page}"
-                   f"&query={keyword}&resultset=catalog&sort=popular&spp=0&suppressSpellcheck=false")
-            try_number = 0
-            try_success = False
-            while try_number < settings.REQUEST_PAGE_ITEMS_ATTEMPTS_AMOUNT and not try_success:
-                try_number += 1
-                try:
-                    response = requests.get(url)
-                    response_json = response.json()
-                    products = response_json["data"]["products"]
-                    page_vendor_codes = [x["id"] for x in products]
-                    logs = {x["id"]: x["log"] for x in products if "log" in x and len(x["log"])}
-                    if len(page_vendor_codes) == settings.DEFAULT_PAGE_CAPACITY:
-                        try_success = True
-                    if "original" in response_json["metadata"]:
-                        # страницы закончились, теперь идет другая выдача
-                        page = None
-                        break
-                except JSONDecodeError:
-                    if not try_success and try_number >= settings.REQUEST_PAGE_ITEMS_ATTEMPTS_AMOUNT:
-                        page = None
-                        break
-                    else:
-                        # еще одна попытка
-                        time.sleep(1)
-            else:
-                # noinspection PyUnboundLocalVariable
-                page_capacities.append(len(page_vendor_codes))
-                # noinspection PyUnboundLocalVariable
+    return ParsedPosition(list(page_capacities), page, position, promo_page, promo_position)
+
+
+class PageOrder:
+    """
+    Порядок обхода страниц выдачи - сначала страницы, на которых товары были в прошлый раз,
+    затем соседние с ними, с постепенным расширением.
+    """
+
+    def __init__(self, start_pages: Iterable[int]) -> None:
+        self.start_pages = sorted(set(start_pages))
+        self.distance = 0
+        self.queue: deque[int] = deque()
+        self.seen: set[int] = set()
+        # первая страница, которой уже нет в выдаче
+        self.end: int | None = None
+
+    def set_end(self, page: int) -> None:
+        if self.end is None or page < self.end:
+            self.end = page
+
+    def is_valid(self, page: int) -> bool:
+        return page >= 1 and (self.end is None or page < self.end)
+
+    def next_page(self) -> int | None:
+        """Возвращает None, когда все страницы выдачи уже обойдены."""
+
+        while True:
+            while self.queue:
+                page = self.queue.popleft()
+                if self.is_valid(page):
+                    return page
+            if self.end is not None and all(x in self.seen for x in range(1, self.end)):
+                return None
+            for start_page in self.start_pages:
+                for page in (start_page - self.distance, start_page + self.distance):
+                    if self.is_valid(page) and page not in self.seen:
+                        self.seen.add(page)
+                        self.queue.append(page)
+            self.distance += 1
+
+
+# не использовать на прямую, так как нет проверки на наличие товаров
+def parse_keyword_positions(
+        vendor_codes: Iterable[int],
+        keyword: str,
+        dest: str,
+        start_pages: dict[int, int] = None
+) -> dict[int, ParsedPosition]:
+    """
+    Находит позиции сразу всех товаров по одному ключевому запросу, скачивая каждую страницу выдачи один раз.
+
+    Поиск начинается со страниц из start_pages (по умолчанию - с первой) и расширяется в обе стороны.
+    Так как товар встречается в выдаче один раз, результат совпадает с результатом обхода с первой страницы.
+    Емкости пропущенных страниц считаются равными DEFAULT_PAGE_CAPACITY.
+    """
+
+    vendor_codes = set(vendor_codes)
+    if start_pages is None:
+        start_pages = {}
+    order = PageOrder(start_pages.get(x) or 1 for x in vendor_codes)
+    # {vendor_code: page}
+    found: dict[int, int] = {}
+    search_pages: dict[int, SearchPage] = {}
+    capacities: dict[int, int] = {}
+
+    # следующие страницы запрашиваются заранее, пока обрабатывается текущая
+    window = settings.SEARCH_PREFETCH_PAGES
+    executor = ThreadPoolExecutor(window)
+    futures: dict[int, Future] = {}
+    try:
+        while len(found) < len(vendor_codes):
+            while len(futures) < window and (next_page := order.next_page()) is not None:
+                futures[next_page] = executor.submit(fetch_search_page, keyword, dest, next_page)
+            if not futures:
+                break
+            page = next(iter(futures))
+            search_page = futures.pop(page).result()
+
+            if search_page is None or search_page.last:
+                order.set_end(page)
+                # товары, найденные за концом выдачи, не учитываются
+                found = {key: value for key, value in found.items() if value < order.end}
+                continue
+            if not order.is_valid(page):
+                continue
+
+            capacities[page] = len(search_page.vendor_codes)
+            page_vendor_codes = set(search_page.vendor_codes)
+            for vendor_code in vendor_codes - found.keys():
                 if vendor_code in page_vendor_codes:
-                    position = page_vendor_codes.index(vendor_code) + 1
-                    # noinspection PyUnboundLocalVariable
-                    if vendor_code in logs:
-                        promo_page = page
-                        promo_position = position
-                        # предполагается, что емкость каждой страницы совпадает с емкостью первой
-                        page = logs[vendor_code]["position"] // page_capacities[0] + 1
-                        position = logs[vendor_code]["position"] % page_capacities[0] + 1
-                    break
-                page += 1
+                    found[vendor_code] = page
+                    search_pages[page] = search_page
+        not_found_page_capacities = [capacities[x] for x in sorted(capacities) if order.is_valid(x)]
     except KeyError as error:
         if "data" in error.args:
             # если возвращаемая позиция == None => товар не был найден по данному ключевому слову
-            page_capacities = None
-            page = None
-            position = None
-            promo_page = None
-            promo_position = None
+            not_found_page_capacities = None
         else:
             raise error
-    return ParsedPosition(page_capacities, page, position, promo_page, promo_position)
+    finally:
+        # лишние страницы больше не нужны
+        executor.shutdown(wait = False, cancel_futures = True)
+
+    positions: dict[int, ParsedPosition] = {}
+    for vendor_code, page in found.items():
+        page_capacities = [capacities.get(x, settings.DEFAULT_PAGE_CAPACITY) for x in range(1, page + 1)]
+        positions[vendor_code] = get_parsed_position(vendor_code, search_pages[page], page, page_capacities)
+    for vendor_code in vendor_codes - found.keys():
+        if not_found_page_capacities is not None:
+            not_found_page_capacities = list(not_found_page_capacities)
+        positions[vendor_code] = ParsedPosition(not_found_page_capacities, None, None, None, None)
+    return positions
+
+
+# не использовать на прямую, так как нет проверки на наличие товара
+def parse_position(vendor_code: int, keyword: str, dest: str) -> ParsedPosition:
+    return parse_keyword_positions([vendor_code], keyword, dest)[vendor_code]
 
 
 def parse_positions(
         vendor_codes: list[int],
         keywords: list[str],
-        dest: str
+        dest: str,
+        start_pages: list[int | None] = None
 ) -> tuple[dict[tuple[int, str], ParsedPosition], dict[int, Exception]]:
     prices, _ = parse_prices(list(set(vendor_codes)), dest, parse_categories = False)
 
+    if start_pages is None:
+        start_pages = [None] * len(vendor_codes)
+    keywords_vendor_codes: dict[str, list[int]] = defaultdict(list)
+    # {keyword: {vendor_code: start_page}}
+    keywords_start_pages: dict[str, dict[int, int | None]] = defaultdict(dict)
+    for keyword, vendor_code, start_page in zip(keywords, vendor_codes, start_pages):
+        keywords_vendor_codes[keyword].append(vendor_code)
+        keywords_start_pages[keyword][vendor_code] = start_page
+
     positions = {}
     errors = {}
-    for keyword, vendor_code in zip(keywords, vendor_codes):
-        try:
-            if prices[vendor_code].sold_out:
-                position = ParsedPosition(None, None, None, None, None)
+    for keyword, keyword_vendor_codes in keywords_vendor_codes.items():
+        in_stock = []
+        for vendor_code in keyword_vendor_codes:
+            try:
+                if prices[vendor_code].sold_out:
+                    positions[(vendor_code, keyword)] = ParsedPosition(None, None, None, None, None, True)
+                else:
+                    in_stock.append(vendor_code)
+            except Exception as error:
+                errors[vendor_code] = error
+
+        if in_stock:
+            try:
+                keyword_positions = parse_keyword_positions(
+                    in_stock,
+                    keyword,
+                    dest,
+                    keywords_start_pages[keyword]
+                )
+            except Exception as error:
+                errors.update({x: error for x in in_stock})
             else:
-                position = parse_position(vendor_code, keyword, dest)
-            position.sold_out = prices[vendor_code].sold_out
-            positions[(vendor_code, keyword)] = position
-        except Exception as error:
-            errors[vendor_code] = error
+                for vendor_code in in_stock:
+                    positions[(vendor_code, keyword)] = dataclasses.replace(
+                        keyword_positions[vendor_code],
+                        sold_out = False
+                    )
     return positions, errors
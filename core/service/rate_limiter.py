@@ -0,0 +1,79 @@
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+from core.service import file_lock
+from core.settings import Settings
+
+
+settings = Settings()
+
+RATE_LIMITS_PATH = f"{settings.PARSING_RESOURCES_PATH}/rate_limits"
+Path(RATE_LIMITS_PATH).mkdir(parents = True, exist_ok = True)
+
+
+class TokenBucket:
+    """
+    Ведро токенов, общее для всех процессов парсера.
+
+    Состояние (количество токенов и время последнего обновления) хранится в файле
+    и изменяется только под блокировкой этого файла.
+    Если токенов нет, токен берется в долг, а запрос ожидает время, за которое долг восполнится.
+    """
+
+    state_format = "dd"
+
+    def __init__(self, name: str, rate: float, capacity: float) -> None:
+        self.path = f"{RATE_LIMITS_PATH}/{name}.bucket"
+        # токенов в секунду
+        self.rate = rate
+        self.capacity = capacity
+        # файловая блокировка не всегда разделяет потоки одного процесса
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self.lock:
+            descriptor = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0))
+            try:
+                file_lock.lock_file(descriptor)
+                try:
+                    now = time.time()
+                    data = os.read(descriptor, struct.calcsize(self.state_format))
+                    if len(data) == struct.calcsize(self.state_format):
+                        tokens, updated_at = struct.unpack(self.state_format, data)
+                    else:
+                        tokens, updated_at = self.capacity, now
+                    tokens = min(self.capacity, tokens + (now - updated_at) * self.rate) - 1
+                    os.lseek(descriptor, 0, os.SEEK_SET)
+                    os.write(descriptor, struct.pack(self.state_format, tokens, now))
+                finally:
+                    file_lock.unlock_file(descriptor)
+            finally:
+                os.close(descriptor)
+
+        if tokens < 0:
+            time.sleep(-tokens / self.rate)
+
+
+class RateLimiter:
+    """Ограничивает частоту запросов отдельно для каждого семейства хостов (card, search, basket, seller_api)."""
+
+    def __init__(self) -> None:
+        self.buckets = {
+            family: TokenBucket(family, rate, capacity) for family, (rate, capacity) in settings.RATE_LIMITS.items()
+        }
+
+    @staticmethod
+    def get_host_family(host: str) -> str | None:
+        if host.startswith("basket-"):
+            family = settings.BASKET_HOST_FAMILY
+        else:
+            family = settings.HOST_FAMILIES.get(host)
+        return family
+
+    def acquire(self, host: str) -> None:
+        family = self.get_host_family(host)
+        if family in self.buckets:
+            self.buckets[family].acquire()
@@ -0,0 +1,135 @@
+import enum
+import random
+import threading
+import time
+
+from requests import RequestException
+
+from core.settings import Settings
+from logger import Logger
+
+
+settings = Settings()
+logger = Logger(f"{settings.APP_NAME}_resilience")
+
+
+class CircuitOpenError(RequestException):
+    """Хост временно не запрашивается из-за серии ошибок."""
+
+
+def get_backoff_delay(attempt: int) -> float:
+    """
+    Задержка перед повтором номер attempt (начиная с 1) - экспоненциальная с полным случайным разбросом,
+    чтобы повторы разных потоков и процессов не приходились на одно время.
+    """
+
+    upper = min(settings.HTTP_RETRY_BACKOFF_MAX, settings.HTTP_RETRY_BACKOFF_FACTOR * 2 ** (attempt - 1))
+    return random.uniform(0, upper)
+
+
+class RetryBudget:
+    """
+    Ограничивает повторы долей от количества запросов, чтобы при массовых ошибках повторы не умножали нагрузку.
+
+    Каждый запрос пополняет бюджет на ratio повторов, но не больше capacity, каждый повтор тратит один.
+    """
+
+    def __init__(self, ratio: float, capacity: float) -> None:
+        self.ratio = ratio
+        self.capacity = capacity
+        self.tokens = capacity
+        self.lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self.lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                allowed = True
+            else:
+                allowed = False
+        return allowed
+
+
+class CircuitBreaker:
+    """
+    Перестает пропускать запросы к хосту после failure_threshold ошибок подряд.
+
+    Через recovery_time секунд пропускается один пробный запрос:
+    если он успешен, хост снова запрашивается, иначе снова ожидается recovery_time секунд.
+    """
+
+    class State(enum.Enum):
+        CLOSED = "closed"
+        OPEN = "open"
+        HALF_OPEN = "half-open"
+
+    def __init__(self, host: str, failure_threshold: int, recovery_time: float) -> None:
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = self.State.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def set_state(self, state: State) -> None:
+        if state != self.state:
+            message = f"Circuit breaker for {self.host}: {self.state.value} -> {state.value}"
+            if state == self.State.OPEN:
+                logger.warning(f"{message} after {self.failures} failures for {self.recovery_time} s")
+            else:
+                logger.info(message)
+            self.state = state
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == self.State.CLOSED:
+                allowed = True
+            elif self.state == self.State.OPEN and time.monotonic() - self.opened_at >= self.recovery_time:
+                # пробный запрос
+                self.set_state(self.State.HALF_OPEN)
+                allowed = True
+            else:
+                allowed = False
+        return allowed
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.failures = 0
+            self.set_state(self.State.CLOSED)
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.state == self.State.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self.set_state(self.State.OPEN)
+
+
+class HostGuard:
+    """Бюджеты повторов и предохранители, отдельные для каждого хоста."""
+
+    def __init__(self) -> None:
+        self.budgets: dict[str, RetryBudget] = {}
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.lock = threading.Lock()
+
+    def get_budget(self, host: str) -> RetryBudget:
+        with self.lock:
+            if host not in self.budgets:
+                self.budgets[host] = RetryBudget(settings.HTTP_RETRY_BUDGET_RATIO, settings.HTTP_RETRY_BUDGET_CAPACITY)
+            return self.budgets[host]
+
+    def get_breaker(self, host: str) -> CircuitBreaker:
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(
+                    host,
+                    settings.CIRCUIT_BREAKER_FAILURES_AMOUNT,
+                    settings.CIRCUIT_BREAKER_RECOVERY_TIME
+                )
+            return self.breakers[host]
@@ -0,0 +1,129 @@
+import importlib
+import multiprocessing
+import os
+import pickle
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, TYPE_CHECKING
+
+from core.settings import Settings
+from logger import Logger
+
+
+if TYPE_CHECKING:
+    from core import parser as parser_core
+
+
+settings = Settings()
+logger = Logger(f"{settings.APP_NAME}_run_engine")
+
+# парсер процесса движка - создается один раз при запуске процесса
+worker_parser: "parser_core.EngineParserMixin | None" = None
+
+
+def get_parser_path(parser_class: type["parser_core.EngineParserMixin"]) -> str:
+    return f"{parser_class.__module__}.{parser_class.__qualname__}"
+
+
+def get_transferable_error(error: Exception) -> Exception:
+    """Ошибка, которую можно передать в основной процесс, с трассировкой, которая иначе теряется при передаче."""
+
+    if error.__traceback__ is not None:
+        error.add_note("".join(traceback.format_tb(error.__traceback__)))
+    try:
+        pickle.loads(pickle.dumps(error))
+    except Exception:
+        transferable = RuntimeError(f"{type(error).__name__}: {error}")
+        transferable.__notes__ = getattr(error, "__notes__", [])
+        error = transferable
+    return error
+
+
+def init_worker(parser_path: str, parsing_id: int) -> None:
+    """
+    Парсер передается путем, а не классом, так как модели можно импортировать только после настройки django,
+    а аргументы процесса разбираются до вызова этой функции.
+    """
+
+    global worker_parser
+
+    import configure_django  # noqa: F401
+    from core import models as core_models
+
+    module_name, class_name = parser_path.rsplit(".", 1)
+    worker_parser = getattr(importlib.import_module(module_name), class_name)()
+    # все процессы пишут в один парсинг
+    worker_parser.parsing = core_models.Parsing.objects.get(id = parsing_id)
+    worker_parser.parsing.not_parsed_items = {}
+
+
+def parse_shard(shard: list[int]) -> "parser_core.ShardResult":
+    result = worker_parser.parse_shard(shard)
+    result.errors = {key: get_transferable_error(value) for key, value in result.errors.items()}
+    return result
+
+
+def get_workers_amount(parser: "parser_core.EngineParserMixin") -> int:
+    if not parser.settings.PARALLEL:
+        workers_amount = 1
+    else:
+        workers_amount = settings.RUN_ENGINE_WORKERS_AMOUNT or os.cpu_count()
+    return workers_amount
+
+
+def run(parser_class: type["parser_core.EngineParserMixin"], workers_amount: int = None) -> None:
+    """
+    Запускает парсер без pytest: работа загружается один раз в основном процессе и делится на части,
+    которые разбирают процессы из общей очереди - освободившийся процесс берет следующую часть,
+    поэтому медленные части не задерживают остальные процессы.
+
+    Ошибки всех процессов собираются в один парсинг.
+    """
+
+    # модели импортируются только после настройки django
+    from core import parser as parser_core
+
+    if not issubclass(parser_class, parser_core.EngineParserMixin):
+        raise TypeError(f"{get_parser_path(parser_class)} can not be run by the run engine")
+    parser = parser_class()
+    parser.setup_method()
+    if workers_amount is None:
+        workers_amount = get_workers_amount(parser)
+    shards = parser.get_shards(max(1, workers_amount))
+    workers_amount = max(1, min(workers_amount, len(shards)))
+    logger.info(f"Shards: {len(shards)}, work units: {sum(len(x) for x in shards)}, workers: {workers_amount}")
+
+    # {идентификатор единицы работы: ошибка}
+    errors = {}
+    data = []
+
+    def collect(shard: list[int], get_result: Callable[[], "parser_core.ShardResult"]) -> None:
+        try:
+            result = get_result()
+        except Exception as error:
+            logger.exception(f"Shard of {len(shard)} work units failed")
+            errors.update({x: error for x in shard})
+        else:
+            errors.update(result.errors)
+            data.extend(result.data)
+
+    if workers_amount == 1:
+        # без накладных расходов на запуск процессов
+        for number, shard in enumerate(shards, 1):
+            collect(shard, lambda: parser.parse_shard(shard))
+            logger.info(f"Shards done: {number}/{len(shards)}, errors: {len(errors)}")
+    else:
+        with ProcessPoolExecutor(
+                workers_amount,
+                # одинаково на всех платформах - без унаследованных соединений с БД
+                mp_context = multiprocessing.get_context("spawn"),
+                initializer = init_worker,
+                initargs = (get_parser_path(parser_class), parser.parsing.id)
+        ) as executor:
+            futures = {executor.submit(parse_shard, x): x for x in shards}
+            for number, future in enumerate(as_completed(futures), 1):
+                collect(futures[future], future.result)
+                logger.info(f"Shards done: {number}/{len(shards)}, errors: {len(errors)}")
+
+    parser.finish(errors, data)
+    parser.teardown_method()
@@ -0,0 +1,107 @@
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+
+from core.settings import Settings
+
+
+settings = Settings()
+
+Path(settings.PARSING_RESOURCES_PATH).mkdir(parents = True, exist_ok = True)
+SEARCH_CACHE_PATH = f"{settings.PARSING_RESOURCES_PATH}/search_pages.sqlite3"
+
+# (vendor_codes, {vendor_code: рекламная позиция}, last)
+CachedSearchPage = tuple[list[int], dict[int, int], bool]
+
+
+class SearchPageCache:
+    """
+    Общий для процессов и запусков кэш страниц поисковой выдачи с ограниченным временем жизни и размером.
+
+    Хранит только артикулы и рекламные позиции, упакованные в массивы.
+    Когда записей больше SEARCH_CACHE_MAX_SIZE, удаляются те, что дольше всего не использовались.
+    """
+
+    # размер проверяется не при каждой записи
+    eviction_period = 100
+
+    def __init__(self, path: str = SEARCH_CACHE_PATH) -> None:
+        self.ttl = settings.SEARCH_CACHE_TTL
+        self.max_size = settings.SEARCH_CACHE_MAX_SIZE
+        self.lock = threading.Lock()
+        self.puts_amount = 0
+        self.connection = sqlite3.connect(path, timeout = 30, isolation_level = None, check_same_thread = False)
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS search_page ("
+                "keyword TEXT, dest TEXT, page INTEGER, sort TEXT,"
+                "vendor_codes BLOB, log_vendor_codes BLOB, log_positions BLOB, last INTEGER,"
+                "fetched_at REAL, used_at REAL,"
+                "PRIMARY KEY (keyword, dest, page, sort))"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS search_page_used_at ON search_page (used_at)")
+
+    def get(self, keyword: str, dest: str, page: int, sort: str) -> CachedSearchPage | None:
+        now = time.time()
+        key = (keyword, dest, page, sort)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT vendor_codes, log_vendor_codes, log_positions, last FROM search_page "
+                "WHERE keyword = ? AND dest = ? AND page = ? AND sort = ? AND fetched_at >= ?",
+                (*key, now - self.ttl)
+            ).fetchone()
+            if row is not None:
+                self.connection.execute(
+                    "UPDATE search_page SET used_at = ? WHERE keyword = ? AND dest = ? AND page = ? AND sort = ?",
+                    (now, *key)
+                )
+
+        if row is None:
+            cached_page = None
+        else:
+            vendor_codes, log_vendor_codes, log_positions, last = row
+            cached_page = (
+                self.unpack(vendor_codes),
+                dict(zip(self.unpack(log_vendor_codes), self.unpack(log_positions))),
+                bool(last)
+            )
+        return cached_page
+
+    def put(self, keyword: str, dest: str, page: int, sort: str, cached_page: CachedSearchPage) -> None:
+        now = time.time()
+        vendor_codes, logs, last = cached_page
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO search_page VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    keyword, dest, page, sort,
+                    self.pack(vendor_codes), self.pack(logs.keys()), self.pack(logs.values()), int(last),
+                    now, now
+                )
+            )
+            self.puts_amount += 1
+            if self.puts_amount % self.eviction_period == 0:
+                self.evict(now)
+
+    def evict(self, now: float) -> None:
+        self.connection.execute("DELETE FROM search_page WHERE fetched_at < ?", (now - self.ttl,))
+        size = self.connection.execute("SELECT COUNT(*) FROM search_page").fetchone()[0]
+        if size > self.max_size:
+            self.connection.execute(
+                "DELETE FROM search_page WHERE rowid IN "
+                "(SELECT rowid FROM search_page ORDER BY used_at LIMIT ?)",
+                (size - self.max_size,)
+            )
+
+    @staticmethod
+    def pack(values) -> bytes:
+        return array('Q', values).tobytes()
+
+    @staticmethod
+    def unpack(data: bytes) -> list[int]:
+        values = array('Q')
+        values.frombytes(data)
+        return values.tolist()
@@ -0,0 +1,38 @@
+import heapq
+import statistics
+from typing import Hashable, Iterable, TypeVar
+
+
+Unit = TypeVar("Unit", bound = Hashable)
+
+
+def get_default_cost(costs: Iterable[float]) -> float:
+    """Стоимость работы без истории - средняя по известным."""
+
+    costs = list(costs)
+    return statistics.fmean(costs) if costs else 1
+
+
+def plan_shards(
+        groups: dict[Hashable, list[Unit]],
+        costs: dict[Hashable, float],
+        shards_amount: int
+) -> list[list[Unit]]:
+    """
+    Делит группы единиц работы на shards_amount частей с примерно равной суммарной стоимостью
+    (longest processing time first): группы берутся от самой дорогой к самой дешевой, и каждая попадает в часть
+    с наименьшей стоимостью на данный момент. Группа целиком попадает в одну часть.
+
+    План детерминирован - одинаков во всех процессах при одинаковых данных.
+    Части возвращаются от самой дорогой к самой дешевой, в том числе пустые.
+    """
+
+    shards: list[list[Unit]] = [[] for _ in range(shards_amount)]
+    # (стоимость, номер части)
+    loads = [(0.0, x) for x in range(shards_amount)]
+    for key in sorted(groups, key = lambda x: (-costs[x], str(x))):
+        load, number = heapq.heappop(loads)
+        shards[number].extend(groups[key])
+        heapq.heappush(loads, (load + costs[key], number))
+    shard_costs = dict((number, load) for load, number in loads)
+    return [shards[x] for x in sorted(range(shards_amount), key = lambda x: -shard_costs[x])]
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Generic, Hashable, TypeVar
+
+import openpyxl
+
+from core.settings import Settings
+
+
+settings = Settings()
+
+Path(settings.SPREADSHEET_CACHE_PATH).mkdir(parents = True, exist_ok = True)
+
+Row = tuple[Any, ...]
+T = TypeVar("T")
+# (время изменения в наносекундах, размер) - None, если файла нет
+Signature = tuple[int, int] | None
+
+# {(путь, количество столбцов): (подпись файла, строки)}
+memory_cache: dict[tuple[str, int], tuple[Signature, list[Row]]] = {}
+lock = threading.Lock()
+
+
+def get_signature(path: str) -> Signature:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        signature = None
+    else:
+        signature = (stat.st_mtime_ns, stat.st_size)
+    return signature
+
+
+def has_changed(path: str, signature: Signature) -> bool:
+    """Дешевая проверка без чтения файла - изменился ли он с момента получения signature."""
+
+    return get_signature(path) != signature
+
+
+def read_rows(path: str, columns_amount: int) -> list[Row]:
+    """
+    Читает первые columns_amount столбцов активного листа потоково (read only), пропуская строку заголовков,
+    до первой строки с пустым первым столбцом.
+    """
+
+    book = openpyxl.load_workbook(path, read_only = True, data_only = True)
+    try:
+        rows = []
+        for row in book.active.iter_rows(min_row = 2, max_col = columns_amount, values_only = True):
+            if not row or not row[0]:
+                break
+            rows.append(tuple(row) + (None,) * (columns_amount - len(row)))
+    finally:
+        # в режиме read only файл остается открытым до закрытия книги
+        book.close()
+    return rows
+
+
+def get_disk_cache_path(path: str, columns_amount: int) -> str:
+    key = hashlib.sha1(f"{os.path.abspath(path)}:{columns_amount}".encode()).hexdigest()
+    return f"{settings.SPREADSHEET_CACHE_PATH}/{Path(path).stem}_{key[:12]}.json"
+
+
+def load_disk_cache(path: str, columns_amount: int, signature: Signature) -> list[Row] | None:
+    try:
+        with open(get_disk_cache_path(path, columns_amount), 'r', encoding = "utf-8") as file:
+            data = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if data.get("signature") != list(signature):
+        return None
+    return [tuple(x) for x in data["rows"]]
+
+
+def save_disk_cache(path: str, columns_amount: int, signature: Signature, rows: list[Row]) -> None:
+    cache_path = get_disk_cache_path(path, columns_amount)
+    # запись через временный файл, чтобы параллельные процессы не прочитали файл частично
+    temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'w', encoding = "utf-8") as file:
+        json.dump({"signature": signature, "rows": rows}, file, ensure_ascii = False, default = str)
+    os.replace(temporary_path, cache_path)
+
+
+def get_rows(path: str, columns_amount: int) -> tuple[list[Row], Signature]:
+    """
+    Строки таблицы и подпись файла, по которой они прочитаны.
+
+    Разобранные строки кэшируются в памяти и на диске по времени изменения и размеру файла,
+    поэтому файл читается заново только после изменения.
+    """
+
+    signature = get_signature(path)
+    if signature is None:
+        raise FileNotFoundError(path)
+    key = (path, columns_amount)
+    with lock:
+        cached = memory_cache.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1], signature
+
+        rows = load_disk_cache(path, columns_amount, signature)
+        if rows is None:
+            rows = read_rows(path, columns_amount)
+            # файл мог измениться во время чтения - тогда подпись не совпадет при следующем обращении
+            save_disk_cache(path, columns_amount, signature, rows)
+        memory_cache[key] = (signature, rows)
+    return rows, signature
+
+
+class SpreadsheetIndex(Generic[T]):
+    """
+    Данные, построенные по строкам таблицы функцией build, - перестраиваются, только если изменилась таблица
+    или переданная в get версия (например, количество связанных строк в БД).
+    """
+
+    def __init__(self, path: str, columns_amount: int, build: Callable[[list[Row]], T]) -> None:
+        self.path = path
+        self.columns_amount = columns_amount
+        self.build = build
+        self.signature: Signature = None
+        self.version: Hashable = None
+        self.value: T | None = None
+        self.lock = threading.Lock()
+
+    def get(self, version: Hashable = None) -> T:
+        with self.lock:
+            if self.value is None or version != self.version or has_changed(self.path, self.signature):
+                rows, self.signature = get_rows(self.path, self.columns_amount)
+                self.value = self.build(rows)
+                self.version = version
+            return self.value
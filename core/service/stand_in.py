@@ -0,0 +1,216 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+
+from core.settings import Settings
+
+
+settings = Settings()
+
+CARD_FAMILY = "card"
+
+
+def get_family(host: str) -> str | None:
+    """Семейство хоста API Wildberries, под которым его ответы хранятся и отдаются подменным сервером."""
+
+    if host.startswith("basket-"):
+        # у каждого хоста basket-NN.wb.ru свои карточки
+        family = host.split(".")[0]
+    else:
+        family = settings.HOST_FAMILIES.get(host)
+    return family
+
+
+def get_fixture_key(family: str, path: str, query: dict[str, str]) -> str:
+    return f"{family}{path}?{urlencode(sorted(query.items()))}"
+
+
+def parse_served_path(path: str) -> tuple[str, str, dict[str, str]]:
+    """
+    Разбирает путь запроса к подменному серверу - /{семейство}/{путь на настоящем хосте}?{параметры}.
+
+    Возвращает семейство, ключ записанного ответа и параметры запроса.
+    """
+
+    parts = urlsplit(path)
+    family, _, real_path = parts.path.lstrip("/").partition("/")
+    query = dict(parse_qsl(parts.query))
+    return family, get_fixture_key(family, f"/{real_path}", query), query
+
+
+def get_card_body(products: list[bytes]) -> bytes:
+    return b'{"state":0,"data":{"products":[' + b",".join(products) + b"]}}"
+
+
+class FixtureStore:
+    """
+    Записанные ответы API Wildberries.
+
+    Товары card.wb.ru хранятся по отдельности, чтобы собирать из них ответы на запросы с любым набором артикулов,
+    остальные ответы - целиком по адресу запроса.
+    """
+
+    def __init__(self, path: str = None) -> None:
+        if path is None:
+            path = settings.STAND_IN_FIXTURES_PATH
+        Path(path).parent.mkdir(parents = True, exist_ok = True)
+        self.connection = sqlite3.connect(path, timeout = 30, isolation_level = None, check_same_thread = False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS response (key TEXT PRIMARY KEY, status INTEGER, body BLOB)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS card_product "
+                "(dest TEXT, vendor_code INTEGER, body BLOB, PRIMARY KEY (dest, vendor_code))"
+            )
+
+    def get_response(self, key: str) -> tuple[int, bytes] | None:
+        with self.lock:
+            return self.connection.execute("SELECT status, body FROM response WHERE key = ?", (key,)).fetchone()
+
+    def put_response(self, key: str, status: int, body: bytes) -> None:
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO response VALUES (?, ?, ?)", (key, status, body))
+
+    def get_card_products(self, dest: str, vendor_codes: list[int]) -> list[bytes]:
+        with self.lock:
+            rows = dict(
+                self.connection.execute(
+                    f"SELECT vendor_code, body FROM card_product "
+                    f"WHERE dest = ? AND vendor_code IN ({', '.join('?' * len(vendor_codes))})",
+                    (dest, *vendor_codes)
+                ).fetchall()
+            )
+        # порядок товаров - как в запросе
+        return [rows[x] for x in vendor_codes if x in rows]
+
+    def put_card_products(self, dest: str, products: list[dict]) -> None:
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO card_product VALUES (?, ?, ?)",
+                ((dest, x["id"], json.dumps(x, ensure_ascii = False).encode()) for x in products)
+            )
+
+
+class Recorder:
+    """Записывает успешные ответы API Wildberries в хранилище подменного сервера."""
+
+    def __init__(self, store: FixtureStore = None) -> None:
+        if store is None:
+            store = FixtureStore()
+        self.store = store
+
+    def record(self, url: str, params: dict | None, response: requests.Response) -> None:
+        parts = urlsplit(url)
+        family = get_family(parts.hostname)
+        if family is None or response.status_code != 200:
+            return
+        query = dict(parse_qsl(parts.query))
+        if params is not None:
+            query.update({key: str(value) for key, value in params.items()})
+
+        if family == CARD_FAMILY:
+            try:
+                products = json.loads(response.content)["data"]["products"]
+            except (ValueError, KeyError):
+                return
+            self.store.put_card_products(query.get("dest", ""), products)
+        else:
+            self.store.put_response(get_fixture_key(family, parts.path, query), response.status_code, response.content)
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    server: "StandInServer"
+
+    def send_body(self, status: int, body: bytes = b"", headers: dict[str, str] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        family, key, query = parse_served_path(self.path)
+
+        time.sleep(random.uniform(*self.server.latency))
+        if self.server.is_throttled(family):
+            self.send_body(429, headers = {"Retry-After": "1"})
+        elif random.random() < self.server.error_rate:
+            self.send_body(503)
+        elif family == CARD_FAMILY:
+            vendor_codes = [int(x) for x in query.get("nm", "").split(";") if x]
+            if self.server.card_chunk_limit is not None and len(vendor_codes) > self.server.card_chunk_limit:
+                self.send_body(400)
+            else:
+                products = self.server.store.get_card_products(query.get("dest", ""), vendor_codes)
+                self.send_body(200, get_card_body(products[:self.server.card_products_limit]))
+        elif (fixture := self.server.store.get_response(key)) is not None:
+            self.send_body(*fixture)
+        else:
+            self.send_body(404)
+
+    def log_message(self, message_format: str, *args) -> None:
+        # запросов слишком много для вывода каждого
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Подменный сервер API Wildberries, отдающий записанные ответы.
+
+    Позволяет задать задержку ответов, долю ошибочных ответов и ограничение частоты запросов (ответ 429),
+    а также ограничения card.wb.ru - наибольшее количество артикулов в запросе (больше - ответ 400)
+    и наибольшее количество товаров в ответе (остальные отбрасываются).
+    """
+
+    daemon_threads = True
+
+    def __init__(
+            self,
+            address: tuple[str, int] = None,
+            store: FixtureStore = None,
+            latency: tuple[float, float] = None,
+            error_rate: float = None,
+            rate_limit: float | None = None,
+            card_chunk_limit: int | None = None,
+            card_products_limit: int | None = None
+    ) -> None:
+        super().__init__(address or settings.STAND_IN_ADDRESS, StandInRequestHandler)
+        self.store = store or FixtureStore()
+        self.latency = latency if latency is not None else settings.STAND_IN_LATENCY
+        self.error_rate = error_rate if error_rate is not None else settings.STAND_IN_ERROR_RATE
+        self.rate_limit = rate_limit if rate_limit is not None else settings.STAND_IN_RATE_LIMIT
+        self.card_chunk_limit = card_chunk_limit
+        self.card_products_limit = card_products_limit
+        # {семейство: (токены, время обновления)}
+        self.buckets: dict[str, tuple[float, float]] = {}
+        self.buckets_lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def is_throttled(self, family: str) -> bool:
+        if self.rate_limit is None:
+            return False
+        with self.buckets_lock:
+            now = time.monotonic()
+            tokens, updated_at = self.buckets.get(family, (self.rate_limit, now))
+            tokens = min(self.rate_limit, tokens + (now - updated_at) * self.rate_limit)
+            throttled = tokens < 1
+            if not throttled:
+                tokens -= 1
+            self.buckets[family] = (tokens, now)
+        return throttled
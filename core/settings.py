@@ -36,11 +36,130 @@ class Settings:
         self.CORE_RESOURCES_PATH = f"{self.RESOURCES_PATH}/{self.APP_NAME}"
         self.SERVICES_RESOURCES_PATH = f"{self.CORE_RESOURCES_PATH}/services"
         self.PARSING_RESOURCES_PATH = f"{self.SERVICES_RESOURCES_PATH}/parsing"
+        # разобранные входные таблицы парсеров (parser_position.xlsx, parser_price.xlsx)
+        self.SPREADSHEET_CACHE_PATH = f"{self.SERVICES_RESOURCES_PATH}/spreadsheets"
 
         # Настройки парсинга
         # количество попыток запросить товары на странице
         self.REQUEST_PAGE_ITEMS_ATTEMPTS_AMOUNT = 10
         self.DEFAULT_PAGE_CAPACITY = 100
+        # количество страниц поисковой выдачи, запрашиваемых одновременно (1 - последовательно)
+        self.SEARCH_PREFETCH_PAGES = 4
+        # использовать кэш страниц поисковой выдачи
+        self.SEARCH_CACHE_ENABLED = True
+        # время жизни страницы в кэше в секундах
+        self.SEARCH_CACHE_TTL = 600
+        # максимальное количество страниц в кэше
+        self.SEARCH_CACHE_MAX_SIZE = 100000
+        # максимальное количество одновременных запросов к card.wb.ru
+        self.CARD_REQUESTS_MAX_WORKERS = 8
+        # количество товаров в одном запросе к card.wb.ru (начальное, если размер подбирается)
+        self.CARD_CHUNK_SIZE = 100
+        # подбирать количество товаров в запросе к card.wb.ru во время парсинга
+        self.CARD_ADAPTIVE_CHUNK_SIZE = True
+        self.CARD_CHUNK_SIZE_MAX = 1000
+        self.CARD_MAX_URL_LENGTH = 8000
+        # время в секундах, через которое отвергнутый размер части снова может быть опробован
+        self.CARD_CHUNK_CEILING_TTL = 7 * 24 * 60 * 60
+        # статусы ответа card.wb.ru, которыми отвергается слишком большая часть
+        self.CARD_CHUNK_REJECT_STATUSES = (400, 414)
+        # количество попыток получить от card.wb.ru ответ, который удается разобрать
+        self.CARD_CHUNK_ATTEMPTS_AMOUNT = 3
+        # количество товаров, цены которых разбираются и сохраняются в БД одной партией
+        self.PRICE_BATCH_SIZE = 1000
+        # декодер ответов сайта - "orjson" или "json" (используется, если orjson не установлен)
+        self.JSON_DECODER = "orjson"
+        # максимальный известный номер хоста basket-NN.wb.ru
+        self.BASKETS_MAX_NUMBER = 49
+        # количество хостов basket-NN.wb.ru, запрашиваемых одновременно для товара с неизвестным хостом
+        self.BASKETS_RACE_WIDTH = 4
+        # повторы запроса к хосту в гонке - ответы проигравших хостов не ожидаются, поэтому их повторы бесполезны
+        self.BASKETS_RACE_RETRIES_AMOUNT = 0
+        # максимальное количество товаров, предметы которых запрашиваются одновременно
+        self.BASKETS_REQUESTS_MAX_WORKERS = 8
+        # количество дней, в течение которых сохраненный предмет товара считается актуальным
+        self.CATEGORY_CACHE_TTL = 30
+        # парсить позиции во всех городах из cities.json, иначе - только в Москве
+        self.PARSE_ALL_CITIES = False
+        # максимальное количество городов, позиции в которых парсятся одновременно
+        self.CITIES_MAX_WORKERS = 4
+
+        # Настройки HTTP-клиента
+        # количество хостов, для которых хранятся пулы соединений (card, search, basket-01..basket-NN, ...)
+        self.HTTP_POOL_CONNECTIONS = 64
+        # количество соединений, хранимых в пуле одного хоста
+        self.HTTP_POOL_MAX_SIZE = 16
+        # (подключение, чтение) в секундах
+        self.HTTP_TIMEOUT = (5, 60)
+        # повторы запроса при ошибке соединения или статусе из HTTP_RETRY_STATUSES
+        self.HTTP_RETRIES_AMOUNT = 3
+        # задержка перед повтором - случайная от 0 до min({backoff max}, {backoff factor} * 2 ** ({номер повтора} - 1))
+        self.HTTP_RETRY_BACKOFF_FACTOR = 0.5
+        self.HTTP_RETRY_BACKOFF_MAX = 30
+        self.HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+        # каждый запрос к хосту разрешает еще столько повторов, но накопленных повторов не больше capacity
+        self.HTTP_RETRY_BUDGET_RATIO = 0.2
+        self.HTTP_RETRY_BUDGET_CAPACITY = 20
+        # количество ошибок подряд, после которого хост перестает запрашиваться
+        self.CIRCUIT_BREAKER_FAILURES_AMOUNT = 10
+        # время в секундах, на которое хост перестает запрашиваться
+        self.CIRCUIT_BREAKER_RECOVERY_TIME = 30
+
+        # Настройки ограничения частоты запросов (общие для всех процессов парсера)
+        self.RATE_LIMITER_ENABLED = True
+        # {хост: семейство хостов}
+        self.HOST_FAMILIES = {
+            "card.wb.ru": "card",
+            "search.wb.ru": "search",
+            "discounts-prices-api.wb.ru": "seller_api"
+        }
+        # семейство хостов basket-NN.wb.ru
+        self.BASKET_HOST_FAMILY = "basket"
+        # {семейство хостов: (запросов в секунду, максимальное количество накопленных запросов)}
+        self.RATE_LIMITS = {
+            "card": (10, 20),
+            "search": (20, 40),
+            "basket": (50, 100),
+            "seller_api": (1, 5)
+        }
+
+        # Адреса API Wildberries
+        # адрес подменного сервера с записанными ответами (manage.py run_stand_in) - если задан,
+        # все запросы к API Wildberries отправляются на него
+        self.STAND_IN_URL = os.environ.get("STAND_IN_URL")
+        if self.STAND_IN_URL is None:
+            self.CARD_BASE_URL = "https://card.wb.ru"
+            self.SEARCH_BASE_URL = "https://search.wb.ru"
+            # basket - двузначный номер хоста
+            self.BASKET_BASE_URL = "https://basket-{basket}.wb.ru"
+            self.SELLER_API_BASE_URL = "https://discounts-prices-api.wb.ru"
+        else:
+            self.CARD_BASE_URL = f"{self.STAND_IN_URL}/card"
+            self.SEARCH_BASE_URL = f"{self.STAND_IN_URL}/search"
+            self.BASKET_BASE_URL = f"{self.STAND_IN_URL}/basket-{{basket}}"
+            self.SELLER_API_BASE_URL = f"{self.STAND_IN_URL}/seller_api"
+
+        # Настройки подменного сервера
+        # записывать ответы API Wildberries для подменного сервера
+        self.STAND_IN_RECORD = "STAND_IN_RECORD" in os.environ
+        self.STAND_IN_FIXTURES_PATH = f"{self.SERVICES_RESOURCES_PATH}/stand_in/fixtures.sqlite3"
+        self.STAND_IN_ADDRESS = ("127.0.0.1", 8765)
+        # (минимальная, максимальная) задержка ответа в секундах
+        self.STAND_IN_LATENCY = (0.05, 0.2)
+        # доля ответов со статусом 503
+        self.STAND_IN_ERROR_RATE = 0.0
+        # запросов в секунду к одному семейству хостов, сверх которых отвечается 429, None - без ограничения
+        self.STAND_IN_RATE_LIMIT = None
+
+        # Настройки замеров производительности (manage.py run_benchmarks)
+        # результаты всех замеров, по одной записи в строке
+        self.BENCHMARKS_RESULTS_PATH = f"{self.SERVICES_RESOURCES_PATH}/benchmarks/results.jsonl"
+        # масштаб синтетических данных по умолчанию (глубина истории - MAX_HISTORY_DEPTH)
+        self.BENCHMARKS_ITEMS_AMOUNT = 1000
+        self.BENCHMARKS_KEYWORDS_AMOUNT = 200
+        self.BENCHMARKS_PAGES_AMOUNT = 10
+        # задержка ответов подменного сервера - без нее замеряется только работа самого парсера
+        self.BENCHMARKS_LATENCY = (0.0, 0.0)
 
         # Настройки административной панели
         # noinspection SpellCheckingInspection
@@ -83,7 +202,18 @@ class Settings:
         self.CONSOLE_LOG_LEVEL = logging.DEBUG
         self.FILE_LOG_LEVEL = logging.DEBUG
 
+        # Настройки движка запуска парсеров (parse.py)
+        # количество процессов для параллельных парсеров, None - по количеству ядер
+        self.RUN_ENGINE_WORKERS_AMOUNT = None
+        # количество единиц работы (ключевых фраз, товаров) в части, которую процесс берет из общей очереди
+        self.RUN_ENGINE_SHARD_SIZE = 50
+        # количество дней истории позиций, по которой выбираются стартовые страницы поиска
+        # и оценивается стоимость частей работы
+        self.SHARDING_HISTORY_DEPTH = 7
+
         # Настройки pytest
+        # опция parse.py для запуска парсера через pytest-xdist вместо движка запуска
+        self.PYTEST_OPTION = "--pytest"
         if "PYTEST_XDIST_WORKER_COUNT" in os.environ:
             self.PYTEST_XDIST_WORKER_COUNT = int(os.environ["PYTEST_XDIST_WORKER_COUNT"])
         else:
@@ -1,3 +1,434 @@
-from django.test import TestCase
+import contextlib
+import random
+import statistics
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from typing import Iterator
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from core.service import (
+    baskets, card_chunks, discounts, file_lock, http_client, parsing, resilience, sharding, stand_in
+)
+
+
+settings = parsing.settings
+
+
+class SearchResult:
+    """Выдача по ключевой фразе: страницы одной емкости, последняя страница выдачи может быть неполной."""
+
+    def __init__(self, generator: random.Random, pages_amount: int) -> None:
+        vendor_codes = generator.sample(range(10 ** 6, 10 ** 7), settings.DEFAULT_PAGE_CAPACITY * pages_amount)
+        last_page_capacity = generator.randint(1, settings.DEFAULT_PAGE_CAPACITY)
+        vendor_codes = vendor_codes[:settings.DEFAULT_PAGE_CAPACITY * (pages_amount - 1) + last_page_capacity]
+        self.pages = [
+            vendor_codes[x:x + settings.DEFAULT_PAGE_CAPACITY]
+            for x in range(0, len(vendor_codes), settings.DEFAULT_PAGE_CAPACITY)
+        ]
+        # рекламные товары
+        self.logs = {x: generator.randrange(len(vendor_codes)) for x in generator.sample(vendor_codes, 5)}
+        self.vendor_codes = vendor_codes
+
+    def fetch_search_page(self, keyword: str, dest: str, page: int, sort: str = "popular") -> parsing.SearchPage:
+        if page <= len(self.pages):
+            vendor_codes = self.pages[page - 1]
+            search_page = parsing.SearchPage(vendor_codes, {x: self.logs[x] for x in vendor_codes if x in self.logs},
+                                             False)
+        else:
+            search_page = parsing.SearchPage([], {}, True)
+        return search_page
+
+    def scan(self, vendor_code: int) -> parsing.ParsedPosition:
+        """Обход с первой страницы по одному товару, как до поиска сразу нескольких товаров."""
+
+        page_capacities = []
+        for page, vendor_codes in enumerate(self.pages, 1):
+            page_capacities.append(len(vendor_codes))
+            if vendor_code in vendor_codes:
+                position = vendor_codes.index(vendor_code) + 1
+                if vendor_code in self.logs:
+                    return parsing.ParsedPosition(
+                        page_capacities,
+                        self.logs[vendor_code] // page_capacities[0] + 1,
+                        self.logs[vendor_code] % page_capacities[0] + 1,
+                        page,
+                        position
+                    )
+                return parsing.ParsedPosition(page_capacities, page, position, None, None)
+        return parsing.ParsedPosition(page_capacities, None, None, None, None)
+
+
+class ParseKeywordPositionsTest(SimpleTestCase):
+    def test_matches_scan_from_first_page(self) -> None:
+        generator = random.Random(8)
+        for _ in range(50):
+            search_result = SearchResult(generator, generator.randint(1, 8))
+            vendor_codes = generator.sample(search_result.vendor_codes, generator.randint(1, 6))
+            # отсутствующие в выдаче товары
+            vendor_codes.extend(generator.sample(range(10 ** 5), generator.randint(0, 2)))
+            pages_amount = len(search_result.pages)
+            start_pages = {}
+            for vendor_code in vendor_codes:
+                start_pages[vendor_code] = generator.choice(
+                    [None, 1, generator.randint(1, pages_amount + 3)]
+                    + [x + 1 for x, y in enumerate(search_result.pages) if vendor_code in y]
+                )
+
+            with mock.patch.object(parsing, "fetch_search_page", search_result.fetch_search_page):
+                positions = parsing.parse_keyword_positions(vendor_codes, "keyword", "dest", start_pages)
+
+            for vendor_code in vendor_codes:
+                self.assertEqual(positions[vendor_code], search_result.scan(vendor_code), (vendor_code, start_pages))
+
+    def test_page_order_visits_every_page_once(self) -> None:
+        generator = random.Random(8)
+        for _ in range(100):
+            end = generator.randint(1, 30)
+            order = parsing.PageOrder(generator.randint(1, 40) for _ in range(generator.randint(1, 4)))
+            order.set_end(end)
+            pages = []
+            while (page := order.next_page()) is not None:
+                pages.append(page)
+            self.assertEqual(sorted(pages), list(range(1, end)))
+
+
+class ParsePricesBatchTest(SimpleTestCase):
+    def test_failed_products_have_no_categories(self) -> None:
+        error = ValueError("bad product")
+        products = {1: parsing.json_decoding.CardProduct(1000, False, 3, "Brand / Item"), 2: error}
+        with mock.patch.object(parsing, "get_categories", return_value = ({}, {})) as get_categories:
+            prices, errors = parsing.parse_prices_batch(
+                [1, 2], products, {}, None, True, {}, discounts.NearestDiscounts({})
+            )
+        get_categories.assert_called_once_with([1], None, None)
+        self.assertEqual(list(prices), [1])
+        self.assertEqual(errors, {2: error})
+
+
+class BasketResolverTest(SimpleTestCase):
+    def test_learned_vols_are_found(self) -> None:
+        generator = random.Random(3)
+        for _ in range(50):
+            resolver = baskets.BasketResolver()
+            # {vol: basket} - последнее известное значение
+            learned = {}
+            for _ in range(200):
+                vol = generator.randint(0, 300)
+                # соседние vol обычно лежат на одном basket
+                basket = vol // 30 + 1 if generator.random() < 0.8 else generator.randint(1, 12)
+                resolver.learn(vol, basket)
+                learned[vol] = basket
+
+            self.assertEqual(resolver.starts, [x[0] for x in resolver.ranges])
+            for left, right in zip(resolver.ranges, resolver.ranges[1:]):
+                self.assertLessEqual(left[0], left[1])
+                self.assertLess(left[1], right[0])
+            for vol, basket in learned.items():
+                self.assertEqual(resolver.lookup(vol), basket)
+            # сохраненный индекс восстанавливается без изменений
+            self.assertEqual(baskets.BasketResolver(resolver.ranges).ranges, resolver.ranges)
+
+    def test_candidates(self) -> None:
+        resolver = baskets.BasketResolver([[0, 99, 1], [200, 299, 3]])
+        candidates, known = resolver.get_candidates(250)
+        self.assertTrue(known)
+        self.assertEqual(candidates[0], 3)
+        candidates, known = resolver.get_candidates(150)
+        self.assertFalse(known)
+        self.assertEqual(candidates[:3], [1, 2, 3])
+        self.assertEqual(sorted(candidates), list(range(1, settings.BASKETS_MAX_NUMBER + 1)))
+
+    def test_save_prefers_learned_vols(self) -> None:
+        with tempfile.TemporaryDirectory() as folder, \
+                mock.patch.object(baskets, "BASKET_RANGES_PATH", f"{folder}/basket_ranges.json"):
+            file_lock.write_json(baskets.BASKET_RANGES_PATH, [[100, 200, 5]])
+            resolver = baskets.BasketResolver.load()
+            resolver.learn(100, 6)
+            # другой процесс тем временем сохранил свои диапазоны
+            other = baskets.BasketResolver.load()
+            other.learn(300, 7)
+            other.save()
+            resolver.save()
+
+            saved = baskets.BasketResolver.load()
+            self.assertEqual(saved.ranges, [[100, 100, 6], [101, 200, 5], [300, 300, 7]])
+            self.assertEqual(resolver.ranges, saved.ranges)
+
+
+class CardChunkSizerTest(SimpleTestCase):
+    @staticmethod
+    def run_parsing(sizer: card_chunks.CardChunkSizer, accepted: list[int], rejected: list[int] = ()) -> None:
+        for chunk_size in accepted:
+            sizer.accept(chunk_size)
+        for chunk_size in rejected:
+            sizer.shrink(chunk_size, 0, False)
+        sizer.update()
+
+    def test_small_runs_do_not_grow(self) -> None:
+        sizer = card_chunks.CardChunkSizer(100, 1, None, settings.CARD_MAX_URL_LENGTH)
+        for _ in range(5):
+            sizer.accepted = 0
+            self.run_parsing(sizer, [3])
+        self.assertEqual((sizer.size, sizer.floor, sizer.ceiling), (100, 3, None))
+
+    def test_grows_from_accepted_size_below_ceiling(self) -> None:
+        sizer = card_chunks.CardChunkSizer(1000, 1, None, settings.CARD_MAX_URL_LENGTH)
+        self.run_parsing(sizer, [500, 500], [1000])
+        self.assertEqual((sizer.size, sizer.floor, sizer.ceiling), (500, 500, 1000))
+
+        for _ in range(20):
+            sizer.failed = False
+            sizer.accepted = 0
+            self.run_parsing(sizer, [sizer.size])
+            self.assertLess(sizer.size, 1000)
+        self.assertEqual(sizer.size, 999)
+
+    def test_ceiling_expires(self) -> None:
+        with tempfile.TemporaryDirectory() as folder, \
+                mock.patch.object(card_chunks, "CARD_CHUNK_SIZE_PATH", f"{folder}/card_chunk_size.json"):
+            sizer = card_chunks.CardChunkSizer(100, 1, None, settings.CARD_MAX_URL_LENGTH)
+            self.run_parsing(sizer, [50], [100])
+            sizer.save()
+            self.assertEqual(card_chunks.CardChunkSizer.load().ceiling, 100)
+
+            expired = time.time() + settings.CARD_CHUNK_CEILING_TTL + 1
+            with mock.patch.object(card_chunks.time, "time", lambda: expired):
+                self.assertIsNone(card_chunks.CardChunkSizer.load().ceiling)
+
+    def test_save_keeps_ceiling_of_other_processes(self) -> None:
+        with tempfile.TemporaryDirectory() as folder, \
+                mock.patch.object(card_chunks, "CARD_CHUNK_SIZE_PATH", f"{folder}/card_chunk_size.json"):
+            first = card_chunks.CardChunkSizer.load()
+            second = card_chunks.CardChunkSizer.load()
+            self.run_parsing(first, [40], [80])
+            first.save()
+            second.accept(second.size)
+            second.save()
+            saved = card_chunks.CardChunkSizer.load()
+            self.assertEqual(saved.ceiling, 80)
+            self.assertLess(saved.size, 80)
+
+
+class NearestDiscountsTest(SimpleTestCase):
+    @staticmethod
+    def get_nearest_discount(items: list[SimpleNamespace], final_price: int) -> int | None:
+        """Поиск перебором: при одинаковом расстоянии словарь сохраняет товар, стоящий позже."""
+
+        differences = {abs(final_price - item.final_price): item for item in items
+                       if item.final_price and item.personal_discount}
+        return differences[min(differences)].personal_discount if differences else None
+
+    def test_matches_full_search(self) -> None:
+        generator = random.Random(12)
+        for _ in range(50):
+            items_by_categories = {
+                category: [
+                    SimpleNamespace(
+                        final_price = generator.choice([None, 0, generator.randint(1, 50) * 10]),
+                        personal_discount = generator.choice([None, 0, -3, generator.randint(1, 40)])
+                    ) for _ in range(generator.randint(0, 15))
+                ] for category in range(generator.randint(1, 5))
+            }
+            nearest_discounts = discounts.NearestDiscounts(items_by_categories)
+            categories = [generator.randint(0, 5) for _ in range(100)]
+            final_prices = [generator.randint(1, 100) * 5 for _ in categories]
+
+            found = nearest_discounts.get_nearest_discounts(categories, final_prices).tolist()
+            for category, final_price, discount in zip(categories, final_prices, found):
+                expected = self.get_nearest_discount(items_by_categories.get(category, []), final_price)
+                self.assertEqual(None if discount != discount else discount, expected)
+
+
+class SupposedDiscountsTest(SimpleTestCase):
+    price_ranges = ((0, 300), (300, 500), (500, 1000), (1000, 3000), (3000, 2147483647))
+
+    @classmethod
+    def get_supposed_discounts(
+            cls,
+            final_prices: list[int],
+            table: dict[int, dict[int, int | None]]
+    ) -> dict[int, tuple[tuple[int, int], int]]:
+        """Подсчет по диапазонам в цикле - мода или верхняя медиана, если мод несколько."""
+
+        values_by_ranges = {}
+        for category_discounts in table.values():
+            for price, discount in category_discounts.items():
+                if discount is not None:
+                    price_range = next(x for x in cls.price_ranges if price < x[1])
+                    values_by_ranges.setdefault(price_range, []).append(discount)
+        modes_by_ranges = {}
+        for price_range, values in values_by_ranges.items():
+            modes = statistics.multimode(values)
+            modes_by_ranges[price_range] = modes[0] if len(modes) == 1 else statistics.median_high(values)
+        supposed_discounts = {}
+        for final_price in final_prices:
+            price_range = next(x for x in cls.price_ranges if final_price < x[1])
+            supposed_discounts[final_price] = (price_range, modes_by_ranges[price_range])
+        return supposed_discounts
+
+    def test_matches_loop(self) -> None:
+        generator = random.Random(13)
+        prices = [100, 299, 300, 450, 500, 999, 1000, 2500, 3000, 7000]
+        for _ in range(100):
+            table = {
+                category: {x: generator.choice([None, generator.randint(1, 6)]) for x in prices}
+                for category in range(generator.randint(1, 4))
+            }
+            # в каждом диапазоне есть хотя бы одна СПП
+            for price in (100, 300, 500, 1000, 3000):
+                table[0][price] = generator.randint(1, 6)
+            final_prices = [generator.randint(1, 9999) for _ in range(20)]
+            self.assertEqual(
+                discounts.get_supposed_discounts(final_prices, table, self.price_ranges),
+                self.get_supposed_discounts(final_prices, table)
+            )
+
+    def test_prices(self) -> None:
+        final_prices = [999, 1000, 1501, 37]
+        personal_discounts = [25, 3, -4, 50]
+        prices = discounts.get_prices(
+            discounts.numpy.array(final_prices),
+            discounts.numpy.array(personal_discounts, dtype = float)
+        ).tolist()
+        self.assertEqual(prices, [round(x / (100 - y) * 100) for x, y in zip(final_prices, personal_discounts)])
+
+
+@contextlib.contextmanager
+def serve_cards(vendor_codes: list[int], **limits) -> Iterator[stand_in.StandInServer]:
+    """Подменный card.wb.ru с товарами vendor_codes и отдельный клиент, чтобы не задевать состояние хостов."""
+
+    with tempfile.TemporaryDirectory() as folder:
+        store = stand_in.FixtureStore(f"{folder}/fixtures.sqlite3")
+        store.put_card_products("dest", [
+            {"id": x, "salePriceU": 100000, "sizes": [{"stocks": [{"qty": 1}]}], "feedbacks": 1, "brand": "Brand",
+             "name": "Item"} for x in vendor_codes
+        ])
+        server = stand_in.StandInServer(("127.0.0.1", 0), store, (0.0, 0.0), 0.0, None, **limits)
+        server.daemon_threads = False
+        threading.Thread(target = server.serve_forever, daemon = True).start()
+        try:
+            with mock.patch.object(parsing.settings, "CARD_BASE_URL", f"{server.url}/card"), \
+                    mock.patch.object(http_client, "client", http_client.HttpClient()), \
+                    mock.patch.object(http_client.HttpClient, "get_retry_delay", staticmethod(lambda *args: 0)):
+                yield server
+        finally:
+            server.shutdown()
+            server.server_close()
+            store.connection.close()
+
+
+class FetchItemsChunkTest(SimpleTestCase):
+    vendor_codes = list(range(10 ** 6, 10 ** 6 + 100))
+
+    def fetch(self, chunk_sizer: card_chunks.CardChunkSizer) -> tuple[dict, int]:
+        with mock.patch.object(http_client.client, "get", wraps = http_client.client.get) as get:
+            products = parsing.fetch_items_chunk(self.vendor_codes, "dest", chunk_sizer)
+        return products, get.call_count
+
+    def test_rejected_chunk_is_split(self) -> None:
+        chunk_sizer = card_chunks.CardChunkSizer(100, 1, None, settings.CARD_MAX_URL_LENGTH)
+        with serve_cards(self.vendor_codes, card_chunk_limit = 30):
+            products, requests_amount = self.fetch(chunk_sizer)
+        self.assertEqual(sorted(products), self.vendor_codes)
+        # 100 -> 2 * 50 -> 4 * 25
+        self.assertEqual(requests_amount, 7)
+        self.assertEqual(chunk_sizer.ceiling, 50)
+        self.assertEqual(chunk_sizer.accepted, 25)
+
+    def test_pending_chunks_use_shrunk_size(self) -> None:
+        vendor_codes = list(range(10 ** 6, 10 ** 6 + 200))
+        chunk_sizer = card_chunks.CardChunkSizer(50, 1, None, settings.CARD_MAX_URL_LENGTH)
+        chunks = chunk_sizer.get_chunks(vendor_codes, len(parsing.get_items_url([], "dest")))
+        with serve_cards(vendor_codes, card_chunk_limit = 30), \
+                mock.patch.object(settings, "CARD_REQUESTS_MAX_WORKERS", 1):
+            fetched = list(parsing.fetch_items_chunks(chunks, "dest", chunk_sizer))
+        self.assertEqual(sorted(x for _, products, _ in fetched for x in products), vendor_codes)
+        # две первые части построены до отказа, остальные - уже по уменьшенному размеру
+        self.assertEqual([len(x) for x, _, _ in fetched], [50, 50, 25, 25, 25, 25])
+
+    def test_state_is_shared_between_shards(self) -> None:
+        vendor_codes = list(range(10 ** 6, 10 ** 6 + 200))
+        with tempfile.TemporaryDirectory() as folder, \
+                mock.patch.object(card_chunks, "CARD_CHUNK_SIZE_PATH", f"{folder}/card_chunk_size.json"), \
+                mock.patch.object(baskets, "BASKET_RANGES_PATH", f"{folder}/basket_ranges.json"), \
+                serve_cards(vendor_codes, card_chunk_limit = 30):
+            state = parsing.PricesState.load({})
+            with mock.patch.object(parsing.PricesState, "load") as load:
+                for shard in (vendor_codes[:100], vendor_codes[100:]):
+                    for _, errors in parsing.iterate_prices(shard, "dest", parse_categories = False, state = state):
+                        self.assertEqual(errors, {})
+            load.assert_not_called()
+            # размер, уменьшенный после отказа, остается в общем состоянии
+            self.assertEqual(state.chunk_sizer.ceiling, 50)
+            self.assertLessEqual(state.chunk_sizer.size, 25)
+            # сохраняет вызывающий код
+            self.assertIsNone(card_chunks.CardChunkSizer.read())
+
+    def test_truncated_response(self) -> None:
+        chunk_sizer = card_chunks.CardChunkSizer(100, 1, None, settings.CARD_MAX_URL_LENGTH)
+        with serve_cards(self.vendor_codes, card_products_limit = 60):
+            products, _ = self.fetch(chunk_sizer)
+        self.assertEqual(sorted(products), self.vendor_codes)
+        self.assertEqual(chunk_sizer.ceiling, 100)
+
+    def test_server_errors_are_not_split(self) -> None:
+        chunk_sizer = card_chunks.CardChunkSizer(100, 1, None, settings.CARD_MAX_URL_LENGTH)
+        with serve_cards(self.vendor_codes) as server, \
+                mock.patch.object(http_client.client, "get", wraps = http_client.client.get) as get:
+            server.error_rate = 1.0
+            with self.assertRaises(ValueError):
+                parsing.fetch_items_chunk(self.vendor_codes, "dest", chunk_sizer)
+        # только повторы клиента, без деления части
+        self.assertLessEqual(get.call_count, settings.CARD_CHUNK_ATTEMPTS_AMOUNT)
+        self.assertFalse(chunk_sizer.failed)
+        self.assertIsNone(chunk_sizer.ceiling)
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    def test_undecodable_pages_open_breaker(self) -> None:
+        client = http_client.HttpClient()
+        response = mock.Mock(status_code = 200, content = b"<html>captcha</html>", headers = {})
+        url = parsing.get_search_url("keyword", "dest", 1)
+        with mock.patch.object(http_client, "client", client), \
+                mock.patch.object(client.session, "get", return_value = response), \
+                mock.patch.object(parsing, "search_page_cache", None), \
+                mock.patch.object(parsing.time, "sleep"):
+            # ответы 200, которые не разбираются, не сбрасывают счетчик ошибок
+            for _ in range(settings.CIRCUIT_BREAKER_FAILURES_AMOUNT):
+                with contextlib.suppress(resilience.CircuitOpenError):
+                    parsing.fetch_search_page("keyword", "dest", 1)
+            breaker = client.host_guard.get_breaker(http_client.urlsplit(url).hostname)
+            self.assertEqual(breaker.state, resilience.CircuitBreaker.State.OPEN)
+            with self.assertRaises(resilience.CircuitOpenError):
+                parsing.fetch_search_page("keyword", "dest", 1)
+
+
+class PlanShardsTest(SimpleTestCase):
+    def test_plan(self) -> None:
+        generator = random.Random(23)
+        for _ in range(100):
+            groups = {f"group {x}": [f"{x}_{y}" for y in range(generator.randint(1, 4))]
+                      for x in range(generator.randint(0, 40))}
+            costs = {x: generator.choice([1, 1, 2, 5, 20]) for x in groups}
+            shards_amount = generator.randint(1, 8)
+
+            shards = sharding.plan_shards(groups, costs, shards_amount)
+            self.assertEqual(shards, sharding.plan_shards(dict(reversed(groups.items())), costs, shards_amount))
+            self.assertEqual(len(shards), shards_amount)
+            self.assertEqual(sorted(x for shard in shards for x in shard),
+                             sorted(x for units in groups.values() for x in units))
+            group_shards = {}
+            for number, shard in enumerate(shards):
+                for unit in shard:
+                    group_shards.setdefault(unit.split("_")[0], set()).add(number)
+            self.assertTrue(all(len(x) == 1 for x in group_shards.values()))
+
+            loads = [sum(costs[name] for name in groups if groups[name][0] in shard) for shard in shards]
+            self.assertEqual(loads, sorted(loads, reverse = True))
+            if groups:
+                # каждая группа попадает в наименее загруженную часть
+                self.assertLessEqual(loads[0] - loads[-1], max(costs.values()))
@@ -2,13 +2,13 @@ import json
 import time
 from typing import TYPE_CHECKING
 
-import requests
 from parsing_helper.web_elements import ExtendedWebElement, ExtendedWebElementCollection
 from requests.exceptions import JSONDecodeError
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.expected_conditions import presence_of_all_elements_located
 
+from core.service import http_client
 from .wildberries_base_page import WildberriesPage
 
 
@@ -49,7 +49,7 @@ class MainPage(WildberriesPage):
             "query": address,
             "limit": 1
         }
-        response = requests.get(url, params)
+        response = http_client.get(url, params)
 
         try:
             data = response.json()["data"]
@@ -81,7 +81,7 @@ class MainPage(WildberriesPage):
             "currency": "RUB",
             "locale": "ru"
         }
-        response = requests.get(url, params)
+        response = http_client.get(url, params)
         data = response.json()["xinfo"].split("&")
         dest = data[2].split("=")[-1]
         regions = data[3].split("=")[-1]
@@ -1,11 +1,15 @@
+import argparse
 import copy
 import sys
 
 import pytest
 
-from core import settings as core_settings
-from parser_position import settings as parser_position_settings
-from parser_price import settings as parser_price_settings
+# django настраивается до импорта моделей, в том числе в процессах движка запуска
+import configure_django  # noqa: F401
+from core import parser as parser_core, settings as core_settings
+from core.service import run_engine
+from parser_position import parser as parser_position_parser, settings as parser_position_settings
+from parser_price import parser as parser_price_parser, settings as parser_price_settings
 from parser_seller_api import settings as parser_seller_api_setting
 
 
@@ -23,19 +27,31 @@ class Runner:
         command = sys.argv[1]
         if command == self.settings.COMMAND_POSITION:
             self.settings = parser_position_settings.Settings()
+            parser_class = parser_position_parser.Parser
         elif command == self.settings.COMMAND_PRICE:
             self.settings = parser_price_settings.Settings()
+            parser_class = parser_price_parser.Parser
         elif command == self.settings.COMMAND_SELLER_API:
             raise ValueError("This parser is deprecated as standalone.")
             # self.settings = parser_seller_api_setting.Settings()
         else:
             raise UnknownParserOption(command)
 
-        # опции командной строки, которые будут переданы в pytest
-        pytest_options = sys.argv[2:]
-        self.before_pytest()
-        self.pytest(pytest_options)
-        self.after_pytest()
+        if sys.argv[2:3] == [self.settings.PYTEST_OPTION]:
+            # опции командной строки, которые будут переданы в pytest
+            pytest_options = sys.argv[3:]
+            self.before_pytest()
+            self.pytest(pytest_options)
+            self.after_pytest()
+        else:
+            self.run_engine(parser_class, sys.argv[2:])
+
+    @staticmethod
+    def run_engine(parser_class: type[parser_core.EngineParserMixin], args: list[str]) -> None:
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--workers", type = int, help = "количество процессов")
+        options = parser.parse_args(args)
+        run_engine.run(parser_class, options.workers)
 
     def before_pytest(self) -> None:
         pass
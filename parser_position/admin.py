@@ -171,8 +171,7 @@ class PreparedPositionItemNameListFilter(PreparedPositionFilter):
     parameter_name = "keyword__item_name"
 
     def lookups(self, request: HttpRequest, model_admin: "PreparedPositionAdmin") -> list[tuple[str, str]]:
-        actual_keywords = parser.Parser.get_position_parser_keywords(1, 0)
-        item_names = [(x, x) for x in sorted(set(y.item_name for y in actual_keywords))]
+        item_names = [(x, x) for x in parser.Parser.get_actual_keywords().item_names]
         return item_names
 
     def queryset(self, request: HttpRequest, queryset: django_models.QuerySet) -> django_models.QuerySet:
@@ -202,9 +201,9 @@ class PreparedPositionActualListFilter(PreparedPositionFilter):
 
     def queryset(self, request: HttpRequest, queryset: django_models.QuerySet) -> django_models.QuerySet:
         if self.value() is None:
-            actual_keywords = parser.Parser.get_position_parser_keywords(1, 0)
+            actual_keywords = parser.Parser.get_actual_keywords()
             queryset = queryset.filter(
-                position__keyword__in = actual_keywords, position__keyword__item__user = self.user
+                position__keyword__id__in = actual_keywords.keyword_ids, position__keyword__item__user = self.user
             )
         return queryset
 
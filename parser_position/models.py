@@ -93,6 +93,47 @@ class Position(ParserPositionModel):
         ).order_by("id").last()
         return obj
 
+    @classmethod
+    def get_last_pages(cls, keywords: Iterable[Keyword], city: str) -> dict[int, int]:
+        """
+        Страницы, на которых товары были найдены в последний раз - {keyword_id: page}.
+
+        Просматриваются только последние SHARDING_HISTORY_DEPTH дней, чтобы стоимость запроса не росла с историей.
+        """
+
+        border = datetime.date.today() - datetime.timedelta(settings.SHARDING_HISTORY_DEPTH)
+        last_positions = cls.objects.filter(keyword__in = keywords, city = city, parsing__date__gte = border).order_by(
+            "keyword_id",
+            # parsing__time -> id потому что у разработчика время на машине отличается от того,
+            # на которой происходит парсинг
+            "-id"
+        ).distinct("keyword_id").values_list("keyword_id", "page", "promo_page")
+        # при рекламе товар находится в выдаче на рекламной странице
+        return {keyword_id: promo_page or page for keyword_id, page, promo_page in last_positions
+                if promo_page or page}
+
+    @classmethod
+    def get_last_pages_reached(cls, values: Iterable[str], before: datetime.date) -> dict[tuple[int, str], int]:
+        """
+        Количество страниц выдачи, до которого дошел последний до даты before парсинг ключевой фразы, -
+        {(vendor_code, value): pages}. Если товар не был найден, это все страницы выдачи.
+
+        Просматриваются только последние SHARDING_HISTORY_DEPTH дней, чтобы стоимость запроса не росла с историей.
+        """
+
+        last_positions = cls.objects.filter(
+            keyword__value__in = values,
+            parsing__date__lt = before,
+            parsing__date__gte = before - datetime.timedelta(settings.SHARDING_HISTORY_DEPTH),
+            page_capacities__isnull = False
+        ).order_by(
+            "keyword_id",
+            # parsing__time -> id потому что у разработчика время на машине отличается от того,
+            # на которой происходит парсинг
+            "-id"
+        ).distinct("keyword_id").values_list("keyword__item__vendor_code", "keyword__value", "page_capacities")
+        return {(vendor_code, value): len(page_capacities) for vendor_code, value, page_capacities in last_positions}
+
     def movement_from(self, other: "Position") -> int:
         if other is None or other.position is None or self.position is None:
             movement = None
@@ -1,18 +1,37 @@
+import dataclasses
+import datetime
+import math
 import platform
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterable
 
-import openpyxl
+from django.db import connection
+from django.db.models import Max
 
 from core import models as core_models, parser as parser_core
-from core.service import parsing
+from core.service import parsing, sharding, spreadsheet
 from . import models, settings
 
 
 City = dict[str, str]
 
 
-class Parser(parser_core.Parser):
+@dataclasses.dataclass(frozen = True, slots = True)
+class ActualKeywords:
+    """Ключевые фразы, которые сейчас прописаны в excel-файле (parser_position.xlsx)."""
+
+    # только уже созданные в БД
+    keyword_ids: frozenset[int]
+    item_names: list[str]
+
+
+class Parser(parser_core.EngineParserMixin, parser_core.Parser):
     settings = settings.Settings()
     parsing_type = core_models.Parsing.Type.POSITION
+    # {keyword_id: keyword} - загружаются в основном процессе движка запуска
+    keywords: dict[int, models.Keyword]
+    actual_keywords_index: spreadsheet.SpreadsheetIndex[ActualKeywords] | None = None
 
     def parse_positions(
             self,
@@ -22,10 +41,12 @@ class Parser(parser_core.Parser):
     ) -> tuple[list[models.Position], dict[models.Item, Exception]]:
         keywords_dict = {(x.item.vendor_code, x.value): x for x in keywords}
         items_dict = {x.vendor_code: x for x in set(keyword.item for keyword in keywords)}
+        last_pages = models.Position.get_last_pages(keywords, city)
         positions, errors = parsing.parse_positions(
             [x.item.vendor_code for x in keywords],
             [x.value for x in keywords],
-            dest
+            dest,
+            [last_pages.get(x.id) for x in keywords]
         )
         errors = {items_dict[vendor_code]: error for vendor_code, error in errors.items()}
         position_objects = [
@@ -46,6 +67,15 @@ class Parser(parser_core.Parser):
 
         return position_objects, errors
 
+    def parse_city(self, keywords: list[models.Keyword], city_dict: City) -> dict[models.Item, Exception]:
+        try:
+            position_objects, errors = self.parse_positions(keywords, city_dict["dest"], city_dict["name"])
+            self.logger.info(f"{city_dict['name']}: positions: {len(position_objects)}, errors: {len(errors)}")
+        finally:
+            # у каждого потока свое соединение с БД, которое иначе останется открытым
+            connection.close()
+        return errors
+
     @staticmethod
     def get_item_uniq_identifier(item_dict: dict[str, str | int]) -> str:
         return f"{item_dict['vendor_code']}_{item_dict['keyword']}"
@@ -55,27 +85,47 @@ class Parser(parser_core.Parser):
         return f"{keyword.item.vendor_code}_{keyword.value}"
 
     @classmethod
-    def get_position_parser_item_dicts(cls) -> dict[str, dict[str, str | int]]:
-        book = openpyxl.load_workbook(cls.settings.PARSER_POSITION_DATA_PATH)
-        sheet = book.active
+    def get_position_parser_item_dicts(cls, rows: list[spreadsheet.Row] = None) -> dict[str, dict[str, str | int]]:
+        if rows is None:
+            rows, _ = spreadsheet.get_rows(cls.settings.PARSER_POSITION_DATA_PATH, 3)
         items = {}
-        row = 2
-        while sheet.cell(row, 1).value:
+        for vendor_code, name, keyword in rows:
             item = {
-                "vendor_code": int(sheet.cell(row, 1).value),
-                "name": sheet.cell(row, 2).value,
-                "keyword": sheet.cell(row, 3).value
+                "vendor_code": int(vendor_code),
+                "name": name,
+                "keyword": keyword
             }
             items[cls.get_item_uniq_identifier(item)] = item
-            row += 1
-
         return items
 
+    @staticmethod
+    def get_values_costs(pairs: Iterable[tuple[int, str]]) -> dict[str, float]:
+        """
+        Оценка стоимости парсинга значений ключевых фраз ({value: cost}) - выдача значения скачивается один раз
+        для всех его товаров, до самой дальней страницы, до которой дошел прошлый парсинг.
+
+        История берется до сегодняшнего дня, чтобы параллельно запущенные процессы получали одинаковый план.
+        """
+
+        pairs = list(pairs)
+        pages = models.Position.get_last_pages_reached({x[1] for x in pairs}, datetime.date.today())
+        default = sharding.get_default_cost(pages.values())
+        costs = {}
+        for pair in pairs:
+            costs[pair[1]] = max(costs.get(pair[1], 0), pages.get(pair, default))
+        return costs
+
     @classmethod
     def get_position_parser_keywords(cls, divisor: int, remainder: int) -> list[models.Keyword]:
         customer = core_models.ParserUser.get_customer()
-        item_dicts = {x[0]: x[1] for index, x in enumerate(cls.get_position_parser_item_dicts().items())
-                      if index % divisor == remainder}
+        item_dicts = cls.get_position_parser_item_dicts()
+        if divisor > 1:
+            groups: dict[str, list[str]] = defaultdict(list)
+            for key, value in item_dicts.items():
+                groups[value["keyword"]].append(key)
+            costs = cls.get_values_costs((x["vendor_code"], x["keyword"]) for x in item_dicts.values())
+            shard = set(sharding.plan_shards(groups, costs, divisor)[remainder])
+            item_dicts = {key: value for key, value in item_dicts.items() if key in shard}
 
         # создание отсутствующих в БД товаров
         old_items_vendor_codes = set(models.Item.objects.values_list("vendor_code", flat = True))
@@ -99,30 +149,106 @@ class Parser(parser_core.Parser):
         keywords = [x for x in models.Keyword.objects.all() if cls.get_keyword_uniq_identifier(x) in item_dicts]
         return keywords
 
-    def run(self, division_remainder: int) -> None:
-        # товары пользователей добавляются только при запуске не на машине разработчика
-        on_developer_pc = platform.node() == self.settings.secrets.developer.pc_name
-
-        keywords_customer = self.get_position_parser_keywords(
-            self.settings.PYTEST_XDIST_WORKER_COUNT,
-            division_remainder
-        )
-        keywords = models.Keyword.objects.filter(id__in = (x.id for x in keywords_customer)).prefetch_related(
-            "item",
-            "item__user"
-        )
+    @classmethod
+    def build_actual_keywords(cls, rows: list[spreadsheet.Row]) -> ActualKeywords:
+        item_dicts = cls.get_position_parser_item_dicts(rows)
+        # выборка по значениям фраз, а не по всей таблице, лишние пары отсекаются по идентификатору
+        keywords = models.Keyword.objects.filter(
+            value__in = set(x["keyword"] for x in item_dicts.values()),
+            item__vendor_code__in = set(x["vendor_code"] for x in item_dicts.values())
+        ).values_list("id", "item__vendor_code", "value", "item_name")
+        keyword_ids = set()
+        identifiers = set()
+        # названия уже созданных фраз берутся из БД, как у фраз, которые возвращает get_position_parser_keywords, -
+        # у всех фраз с идентификатором, в том числе у фраз других пользователей
+        item_names = set()
+        for keyword_id, vendor_code, value, item_name in keywords:
+            identifier = cls.get_item_uniq_identifier({"vendor_code": vendor_code, "keyword": value})
+            if identifier in item_dicts:
+                keyword_ids.add(keyword_id)
+                identifiers.add(identifier)
+                item_names.add(item_name)
+        item_names.update(value["name"] for key, value in item_dicts.items() if key not in identifiers)
+        return ActualKeywords(frozenset(keyword_ids), sorted(x for x in item_names if x is not None))
 
-        self.logger.info(f"Keywords to parse: {len(keywords)}")
-        # todo: оставить только Москву - временное решение
-        for city_dict in [self.settings.MOSCOW_CITY_DICT]:
-            city = city_dict["name"]
-            dest = city_dict["dest"]
-            _, errors = self.parse_positions(keywords, dest, city)
-            self.parsing.not_parsed_items.update(errors)
+    @classmethod
+    def get_actual_keywords(cls) -> ActualKeywords:
+        """
+        Ключевые фразы из excel-файла для фильтров админки - в отличие от get_position_parser_keywords,
+        ничего не пишет в БД. Пересчитываются только при изменении файла или появлении в БД новых фраз.
+        """
+
+        if cls.actual_keywords_index is None:
+            cls.actual_keywords_index = spreadsheet.SpreadsheetIndex(
+                cls.settings.PARSER_POSITION_DATA_PATH,
+                3,
+                cls.build_actual_keywords
+            )
+        return cls.actual_keywords_index.get(models.Keyword.objects.aggregate(Max("id"))["id__max"])
 
+    @staticmethod
+    def get_prefetched_keywords(keywords_ids: Iterable[int]) -> list[models.Keyword]:
+        return list(models.Keyword.objects.filter(id__in = keywords_ids).prefetch_related("item", "item__user"))
+
+    def parse_keywords(self, keywords: list[models.Keyword]) -> dict[models.Item, Exception]:
+        if self.settings.PARSE_ALL_CITIES:
+            city_dicts = self.settings.CITIES
+        else:
+            city_dicts = [self.settings.MOSCOW_CITY_DICT]
+        errors = {}
+        # города парсятся одновременно и используют общие пулы соединений и ограничения частоты запросов
+        with ThreadPoolExecutor(min(len(city_dicts), self.settings.CITIES_MAX_WORKERS)) as executor:
+            futures = {executor.submit(self.parse_city, keywords, x): x for x in city_dicts}
+            for future in as_completed(futures):
+                try:
+                    errors.update(future.result())
+                except Exception as error:
+                    # ошибка одного города (например, записи в БД) не отменяет результаты остальных
+                    self.logger.exception(f"{futures[future]['name']}: city failed")
+                    errors.update({x.item: error for x in keywords})
+        return errors
+
+    def prepare(self, keywords: Iterable[models.Keyword]) -> None:
+        # товары пользователей добавляются только при запуске не на машине разработчика
+        on_developer_pc = platform.node() == self.settings.secrets.developer.pc_name
         if not on_developer_pc:
             keywords_to_prepare = tuple(
                 x for x in keywords if x.item not in self.parsing.not_parsed_items
                 and x.item.user == core_models.ParserUser.get_customer()
             )
             models.PreparedPosition.prepare(keywords_to_prepare)
+
+    def run(self, division_remainder: int) -> None:
+        keywords_customer = self.get_position_parser_keywords(
+            self.settings.PYTEST_XDIST_WORKER_COUNT,
+            division_remainder
+        )
+        keywords = self.get_prefetched_keywords(x.id for x in keywords_customer)
+        self.logger.info(f"Keywords to parse: {len(keywords)}")
+        self.parsing.not_parsed_items.update(self.parse_keywords(keywords))
+        self.prepare(keywords)
+
+    def get_shards(self, workers_amount: int) -> list[list[int]]:
+        """
+        Ключевые фразы с одинаковым значением попадают в одну часть, чтобы их выдача скачивалась один раз.
+        Части примерно равны по стоимости и отдаются от самой дорогой, чтобы процессы заканчивали одновременно.
+        """
+
+        keywords_customer = self.get_position_parser_keywords(1, 0)
+        self.keywords = {x.id: x for x in self.get_prefetched_keywords(x.id for x in keywords_customer)}
+        self.logger.info(f"Keywords to parse: {len(self.keywords)}")
+        groups: dict[str, list[int]] = defaultdict(list)
+        for keyword in self.keywords.values():
+            groups[keyword.value].append(keyword.id)
+        costs = self.get_values_costs((x.item.vendor_code, x.value) for x in self.keywords.values())
+        shards_amount = math.ceil(len(self.keywords) / self.settings.RUN_ENGINE_SHARD_SIZE)
+        return [x for x in sharding.plan_shards(groups, costs, shards_amount) if x]
+
+    def parse_shard(self, shard: list[int]) -> parser_core.ShardResult:
+        keywords = self.get_prefetched_keywords(shard)
+        errors = self.parse_keywords(keywords)
+        return parser_core.ShardResult({x.id: errors[x.item] for x in keywords if x.item in errors})
+
+    def finish(self, errors: dict[int, Exception], data: list) -> None:
+        self.parsing.not_parsed_items = {self.keywords[key].item: value for key, value in errors.items()}
+        self.prepare(self.keywords.values())
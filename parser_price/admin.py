@@ -93,8 +93,7 @@ class PreparedPriceItemNameListFilter(ParserPriceFilter):
     parameter_name = "price__item__name"
 
     def lookups(self, request: HttpRequest, model_admin: "PreparedPriceAdmin") -> list[tuple[str, str]]:
-        actual_keywords = parser.Parser.get_price_parser_items(1, 0)
-        item_names = [(x, x) for x in sorted(set(y.name for y in actual_keywords))]
+        item_names = [(x, x) for x in parser.Parser.get_actual_items().names]
         return item_names
 
     def queryset(self, request: HttpRequest, queryset: django_models.QuerySet) -> django_models.QuerySet:
@@ -121,8 +120,11 @@ class PreparedPriceActualListFilter(ParserPriceFilter):
 
     def queryset(self, request: HttpRequest, queryset: django_models.QuerySet) -> django_models.QuerySet:
         if self.value() is None:
-            actual_items = parser.Parser.get_price_parser_items(1, 0)
-            queryset = queryset.filter(price__item__in = actual_items, price__item__user = self.user)
+            actual_items = parser.Parser.get_actual_items()
+            queryset = queryset.filter(
+                price__item__vendor_code__in = actual_items.vendor_codes,
+                price__item__user = self.user
+            )
         return queryset
 
 
@@ -136,6 +138,11 @@ class CategoryAdmin(ParserPriceAdmin):
     search_fields = ("name",)
 
 
+class CachedCategoryAdmin(ParserPriceAdmin):
+    model = parser_price_models.CachedCategory
+    search_fields = ("vendor_code",)
+
+
 class ItemAdmin(ParserPriceAdmin):
     model = parser_price_models.Item
     list_filter = ("category", "user", "vendor_code")
@@ -242,5 +249,12 @@ class PreparedPriceAdmin(core_admin.DynamicFieldAdminMixin, ParserPriceAdmin):
         return new_queryset
 
 
-model_admins_to_register = [CategoryAdmin, ItemAdmin, PriceAdmin, NotificationAdmin, PreparedPriceAdmin]
+model_admins_to_register = [
+    CategoryAdmin,
+    CachedCategoryAdmin,
+    ItemAdmin,
+    PriceAdmin,
+    NotificationAdmin,
+    PreparedPriceAdmin
+]
 core_admin.register_models(model_admins_to_register)
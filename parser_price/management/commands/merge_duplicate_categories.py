@@ -0,0 +1,10 @@
+from parser_price.management.commands import parser_price_command
+from ... import models
+
+
+class Command(parser_price_command.ParserPriceCommand):
+    help = "Объединяет предметы с одинаковыми названиями перед добавлением ограничения уникальности"
+
+    def handle(self, *args, **options):
+        deleted_amount = models.Category.merge_duplicates()
+        self.logger.info(f"Удалено дубликатов предметов: {deleted_amount}")
@@ -2,7 +2,7 @@ import datetime
 from typing import Iterable, Self
 
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
+from django.db import models, transaction
 
 from core import models as core_models
 from .settings import Settings
@@ -24,11 +24,81 @@ class Category(ParserPriceModel):
         verbose_name_plural = "Categories"
         ordering = ["name"]
 
-    name = models.CharField("Предмет")
+    name = models.CharField("Предмет", unique = True)
 
     def __str__(self) -> str:
         return str(self.name)
 
+    @classmethod
+    def get_or_create_categories(cls, names: Iterable[str]) -> dict[str, Self]:
+        """Возвращает предметы по названиям, создавая недостающие, за постоянное число запросов к БД."""
+
+        names = set(names)
+        categories = {x.name: x for x in cls.objects.filter(name__in = names)}
+        missing = names - set(categories)
+        if missing:
+            # предмет мог быть создан параллельным парсером - конфликты игнорируются, а предметы перечитываются
+            cls.objects.bulk_create([cls(name = x) for x in missing], ignore_conflicts = True)
+            categories.update({x.name: x for x in cls.objects.filter(name__in = missing)})
+        return categories
+
+    @classmethod
+    def merge_duplicates(cls) -> int:
+        """
+        Объединяет предметы с одинаковыми названиями, которые создавались параллельными парсерами
+        до ограничения уникальности названия: ссылки на дубликаты переводятся на предмет с наименьшим id,
+        а дубликаты удаляются. Должен выполняться до миграции, добавляющей ограничение.
+
+        Возвращает количество удаленных предметов.
+        """
+
+        duplicated_names = list(
+            cls.objects.values("name").annotate(amount = models.Count("id")).filter(amount__gt = 1)
+            .values_list("name", flat = True)
+        )
+        deleted_amount = 0
+        with transaction.atomic():
+            for name in duplicated_names:
+                kept, *duplicates = cls.objects.filter(name = name).order_by("id").values_list("id", flat = True)
+                # все внешние ключи на предмет - товары парсера цен, кэш предметов, товары API продавца
+                for relation in cls._meta.related_objects:
+                    relation.related_model.objects.filter(**{f"{relation.field.name}__in": duplicates}) \
+                        .update(**{relation.field.name: kept})
+                deleted_amount += cls.objects.filter(id__in = duplicates).delete()[0]
+        return deleted_amount
+
+
+class CachedCategory(ParserPriceModel):
+    """Предмет, полученный для артикула, чтобы не запрашивать его у basket-NN.wb.ru при каждом парсинге."""
+
+    vendor_code = models.PositiveIntegerField(core_models.Item.get_field_verbose_name("vendor_code"), unique = True)
+    category = models.ForeignKey(
+        Category,
+        models.CASCADE,
+        verbose_name = Category.get_field_verbose_name("name"),
+        related_name = f"{settings.APP_NAME}_cached_category"
+    )
+    fetched_at = models.DateTimeField("Время получения")
+
+    @classmethod
+    def get_categories(cls, vendor_codes: Iterable[int]) -> dict[int, Category]:
+        """Возвращает актуальные предметы для тех артикулов, для которых они есть."""
+
+        border = datetime.datetime.now() - datetime.timedelta(cls.settings.CATEGORY_CACHE_TTL)
+        cached = cls.objects.filter(vendor_code__in = vendor_codes, fetched_at__gte = border).select_related("category")
+        return {x.vendor_code: x.category for x in cached}
+
+    @classmethod
+    def update_categories(cls, categories: dict[int, Category]) -> None:
+        now = datetime.datetime.now()
+        cls.objects.bulk_create(
+            [cls(vendor_code = vendor_code, category = category, fetched_at = now)
+             for vendor_code, category in categories.items()],
+            update_conflicts = True,
+            unique_fields = ["vendor_code"],
+            update_fields = ["category", "fetched_at"]
+        )
+
 
 class Item(ParserPriceModel, core_models.Item):
     user = models.ForeignKey(core_models.ParserUser, models.PROTECT, related_name = f"{settings.APP_NAME}_user")
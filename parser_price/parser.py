@@ -1,71 +1,103 @@
+import dataclasses
+import math
 import platform
-from typing import Any
+from typing import Any, Iterable
 
-import openpyxl
+from django.db.models import Max
 
 import parser_seller_api.parser
 from bot_telegram import bot
 from core import models as core_models, parser as parser_core
-from core.service import parsing, validators
+from core.service import parsing, sharding, spreadsheet, validators
 from parser_price import models, settings
 
 
-class Parser(parser_core.Parser):
+@dataclasses.dataclass(frozen = True, slots = True)
+class ActualItems:
+    """Товары, которые сейчас прописаны в excel-файле (parser_price.xlsx)."""
+
+    vendor_codes: frozenset[int]
+    names: list[str]
+
+
+class Parser(parser_core.EngineParserMixin, parser_core.Parser):
     settings = settings.Settings()
     bot_telegram = bot.Bot()
     parsing_type = core_models.Parsing.Type.PRICE
+    # {item_id: item} - загружаются в основном процессе движка запуска
+    items: dict[int, models.Item]
+    # загружается один раз в каждом процессе движка запуска
+    prices_state: parsing.PricesState | None = None
+    actual_items_index: spreadsheet.SpreadsheetIndex[ActualItems] | None = None
 
     def parse_items(
             self,
             items: list[models.Item],
-            dest: str
-    ) -> tuple[list[models.Price], dict[models.Item, Exception]]:
+            dest: str,
+            prices_state: parsing.PricesState = None
+    ) -> tuple[list[models.Notification], dict[models.Item, Exception]]:
+        """Цены сохраняются в БД партиями по мере получения, поэтому в памяти держится только текущая партия."""
+
         items_dict: dict[int, models.Item] = {x.vendor_code: x for x in items
                                               if validators.validate_subscriptions(x.user)}
         items_categories = {x.vendor_code: x.category for x in items_dict.values()}
-        prices, errors = parsing.parse_prices(list(items_dict), dest, items_categories)
-        errors = {items_dict[vendor_code]: error for vendor_code, error in errors.items()}
-        price_objects = []
-        for vendor_code, price in prices.items():
-            price_object = models.Price(
-                item = items_dict[vendor_code],
-                parsing = self.parsing,
-                reviews_amount = price.reviews_amount,
-                price = price.price,
-                final_price = price.final_price,
-                personal_discount = price.personal_discount,
-                sold_out = price.sold_out
-            )
-
-            price_objects.append(price_object)
-            items_dict[vendor_code].category = price.category
-            items_dict[vendor_code].name_site = price.name_site
-
-        models.Price.objects.bulk_create(price_objects)
-        models.Item.objects.bulk_update(items_dict.values(), ["category", "name_site"])
-
-        return price_objects, errors
+        notifications = []
+        errors = {}
+        parsed_amount = 0
+        for prices, batch_errors in parsing.iterate_prices(
+                list(items_dict),
+                dest,
+                items_categories,
+                state = prices_state
+        ):
+            errors.update({items_dict[vendor_code]: error for vendor_code, error in batch_errors.items()})
+            price_objects = []
+            for vendor_code, price in prices.items():
+                price_object = models.Price(
+                    item = items_dict[vendor_code],
+                    parsing = self.parsing,
+                    reviews_amount = price.reviews_amount,
+                    price = price.price,
+                    final_price = price.final_price,
+                    personal_discount = price.personal_discount,
+                    sold_out = price.sold_out
+                )
+
+                price_objects.append(price_object)
+                items_dict[vendor_code].category = price.category
+                items_dict[vendor_code].name_site = price.name_site
+
+            models.Price.objects.bulk_create(price_objects)
+            models.Item.objects.bulk_update([items_dict[x] for x in prices], ["category", "name_site"])
+            notifications.extend(models.Price.get_notifications(price_objects))
+
+            parsed_amount += len(prices)
+            self.logger.info(f"Parsed prices: {parsed_amount}, errors: {len(errors)}")
+
+        return notifications, errors
 
     @classmethod
-    def get_price_parser_item_dicts(cls) -> dict[int, dict[str, Any]]:
-        book = openpyxl.load_workbook(cls.settings.PARSER_PRICE_DATA_PATH)
-        sheet = book.active
+    def get_price_parser_item_dicts(cls, rows: list[spreadsheet.Row] = None) -> dict[int, dict[str, Any]]:
+        if rows is None:
+            rows, _ = spreadsheet.get_rows(cls.settings.PARSER_PRICE_DATA_PATH, 2)
         items = {}
-        row = 2
-        while sheet.cell(row, 1).value:
-            item = {
-                "vendor_code": sheet.cell(row, 1).value,
-                "name": sheet.cell(row, 2).value
-            }
-            items[item["vendor_code"]] = item
-            row += 1
+        for vendor_code, name in rows:
+            items[vendor_code] = {"vendor_code": vendor_code, "name": name}
         return items
 
+    @staticmethod
+    def plan_shards(units: list[int], shards_amount: int) -> list[list[int]]:
+        """Стоимость всех товаров одинакова - каждый занимает одно место в запросе к card.wb.ru."""
+
+        return sharding.plan_shards({x: [x] for x in units}, dict.fromkeys(units, 1), shards_amount)
+
     @classmethod
     def get_price_parser_items(cls, divisor: int, remainder: int) -> list[models.Item]:
         customer = core_models.ParserUser.get_customer()
-        item_dicts = {x[0]: x[1] for index, x in enumerate(cls.get_price_parser_item_dicts().items())
-                      if index % divisor == remainder}
+        item_dicts = cls.get_price_parser_item_dicts()
+        if divisor > 1:
+            shard = set(cls.plan_shards(list(item_dicts), divisor)[remainder])
+            item_dicts = {key: value for key, value in item_dicts.items() if key in shard}
 
         old_items_vendor_codes = set(models.Item.objects.values_list("vendor_code", flat = True))
         new_items = {
@@ -80,37 +112,124 @@ class Parser(parser_core.Parser):
 
         return list(items)
 
-    def run(self) -> None:
-        # коммит - feat: парсер скидок теперь запускается только вместе с парсером цен и только в один поток
+    @classmethod
+    def build_actual_items(cls, rows: list[spreadsheet.Row]) -> ActualItems:
+        item_dicts = cls.get_price_parser_item_dicts(rows)
+        # названия уже созданных товаров берутся из БД, как у товаров, которые возвращает get_price_parser_items, -
+        # у всех товаров с артикулом, в том числе у товаров других пользователей
+        existing = models.Item.objects.filter(vendor_code__in = item_dicts).values_list("vendor_code", "name")
+        vendor_codes = set()
+        names = set()
+        for vendor_code, name in existing:
+            vendor_codes.add(vendor_code)
+            names.add(name)
+        names.update(value["name"] for key, value in item_dicts.items() if key not in vendor_codes)
+        return ActualItems(frozenset(item_dicts), sorted(x for x in names if x is not None))
+
+    @classmethod
+    def get_actual_items(cls) -> ActualItems:
+        """
+        Товары из excel-файла для фильтров админки - в отличие от get_price_parser_items, ничего не пишет в БД.
+        Пересчитываются только при изменении файла или появлении в БД новых товаров.
+        """
+
+        if cls.actual_items_index is None:
+            cls.actual_items_index = spreadsheet.SpreadsheetIndex(
+                cls.settings.PARSER_PRICE_DATA_PATH,
+                2,
+                cls.build_actual_items
+            )
+        return cls.actual_items_index.get(models.Item.objects.aggregate(Max("id"))["id__max"])
+
+    @property
+    def on_developer_pc(self) -> bool:
+        return platform.node() == self.settings.secrets.developer.pc_name
+
+    def get_items(self) -> list[models.Item]:
         items_customer = self.get_price_parser_items(1, 0)
         # товары пользователей добавляются только при запуске не на машине разработчика
-        on_developer_pc = platform.node() == self.settings.secrets.developer.pc_name
-        if not on_developer_pc:
+        if not self.on_developer_pc:
             items_other = models.Item.objects.exclude(user = core_models.ParserUser.get_customer())
-            items = models.Item.objects.filter(
-                id__in = (x.id for x in (*items_customer, *items_other))
-            ).prefetch_related("user", "category")
+            items_ids = (x.id for x in (*items_customer, *items_other))
         else:
-            items = models.Item.objects.filter(
-                id__in = (x.id for x in items_customer)
-            ).prefetch_related("user", "category")
+            items_ids = (x.id for x in items_customer)
+        return self.get_prefetched_items(items_ids)
 
+    @staticmethod
+    def get_prefetched_items(items_ids: Iterable[int]) -> list[models.Item]:
+        return list(models.Item.objects.filter(id__in = items_ids).prefetch_related("user", "category"))
+
+    @staticmethod
+    def parse_seller_api() -> None:
+        # коммит - feat: парсер скидок теперь запускается только вместе с парсером цен и только в один поток
         parser_api = parser_seller_api.parser.Parser()
         parser_api.setup_method()
         parser_api.run()
         parser_api.teardown_method()
 
+    def prepare(self, items: Iterable[models.Item], errors: dict[models.Item, Exception]) -> None:
+        if not self.on_developer_pc:
+            items_to_prepare = tuple(
+                x for x in items if x not in errors and x.user == core_models.ParserUser.get_customer()
+            )
+            models.PreparedPrice.prepare(items_to_prepare)
+
+    def run(self) -> None:
+        self.parse_seller_api()
+        items = self.get_items()
+
         self.logger.info(f"Items to parse: {len(items)}")
         city_dict = self.settings.MOSCOW_CITY_DICT
         dest = city_dict["dest"]
-        prices, errors = self.parse_items(items, dest)
+        notifications, errors = self.parse_items(items, dest)
         self.parsing.not_parsed_items = errors
 
-        notifications = models.Price.get_notifications(prices)
         self.bot_telegram.notify(notifications)
-
-        if not on_developer_pc:
-            items_to_prepare = tuple(
-                x for x in items if x not in errors and x.user == core_models.ParserUser.get_customer()
+        self.prepare(items, errors)
+
+    def get_shards(self, workers_amount: int) -> list[list[int]]:
+        """
+        Один процесс парсит все товары одной частью - запросы к card.wb.ru и так выполняются параллельно,
+        иначе каждая часть должна занимать все потоки запросов.
+        """
+
+        self.parse_seller_api()
+        self.items = {x.id: x for x in self.get_items()}
+        self.logger.info(f"Items to parse: {len(self.items)}")
+        if workers_amount == 1:
+            shards_amount = 1
+        else:
+            shards_amount = math.ceil(len(self.items) / self.settings.RUN_ENGINE_SHARD_SIZE)
+        return [x for x in self.plan_shards(list(self.items), shards_amount) if x]
+
+    def parse_shard(self, shard: list[int]) -> parser_core.ShardResult:
+        if self.prices_state is None:
+            self.prices_state = parsing.PricesState.load()
+        items = self.get_prefetched_items(shard)
+        try:
+            notifications, errors = self.parse_items(
+                items,
+                self.settings.MOSCOW_CITY_DICT["dest"],
+                self.prices_state
             )
-            models.PreparedPrice.prepare(items_to_prepare)
+        finally:
+            # подобранные размер части и хосты basket сохраняются, даже если часть не допарсилась
+            self.prices_state.save()
+        return parser_core.ShardResult(
+            {key.id: value for key, value in errors.items()},
+            # уведомления отправляются из основного процесса, поэтому передаются только их id
+            [x.id for x in notifications]
+        )
+
+    def finish(self, errors: dict[int, Exception], data: list) -> None:
+        errors = {self.items[key]: value for key, value in errors.items()}
+        self.parsing.not_parsed_items = errors
+        notifications = list(
+            models.Notification.objects.filter(id__in = data).order_by("id").select_related(
+                "new__item__user",
+                "new__item__category",
+                "old"
+            )
+        )
+        self.bot_telegram.notify(notifications)
+        self.prepare(self.items.values(), errors)
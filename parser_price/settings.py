@@ -15,3 +15,9 @@ class Settings(settings.Settings):
 
         # количество парсингов пользователей, хранимых для пользователей
         self.USER_HISTORY_DEPTH = 10
+
+        # каждая часть должна занимать все потоки запросов к card.wb.ru частями наибольшего размера
+        self.RUN_ENGINE_SHARD_SIZE = max(
+            self.PRICE_BATCH_SIZE,
+            self.CARD_REQUESTS_MAX_WORKERS * self.CARD_CHUNK_SIZE_MAX
+        )
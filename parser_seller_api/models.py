@@ -1,10 +1,10 @@
-import statistics
 from collections import defaultdict
 from typing import Iterable
 
 from django.db import models
 
 from core import models as core_models
+from core.service import discounts as service_discounts
 from parser_price import models as parse_price_models
 from .settings import Settings
 
@@ -81,36 +81,7 @@ class Item(ParserSellerApiModel, core_models.Item):
             final_prices: Iterable[int | float],
             discounts: DISCOUNT_TABLE_TYPE
     ) -> dict[int | float, tuple[tuple[int, int], int]]:
-        keys = list(list(discounts.values())[0].keys())
-        range_index = 0
-        keys_by_ranges = defaultdict(list)
-        for key in keys:
-            while range_index < len(cls.settings.PRICE_RANGES) and key >= cls.settings.PRICE_RANGES[range_index][1]:
-                range_index += 1
-            for discount_values in discounts.values():
-                if (discount_value := discount_values[key]) is not None:
-                    keys_by_ranges[cls.settings.PRICE_RANGES[range_index]].append(discount_value)
-
-        modes_by_ranges = {}
-        for price_range, discounts in keys_by_ranges.items():
-            modes = statistics.multimode(discounts)
-            if len(modes) == 1:
-                modes_by_ranges[price_range] = modes[0]
-            else:
-                modes_by_ranges[price_range] = statistics.median_high(discounts)
-
-        supposed_discounts = {}
-        for final_price in final_prices:
-            range_index = 0
-            while (range_index < len(cls.settings.PRICE_RANGES) and
-                   final_price >= cls.settings.PRICE_RANGES[range_index][1]):
-                range_index += 1
-            price_range = cls.settings.PRICE_RANGES[range_index]
-            supposed_discounts[final_price] = (
-                price_range,
-                modes_by_ranges[cls.settings.PRICE_RANGES[range_index]]
-            )
-        return supposed_discounts
+        return service_discounts.get_supposed_discounts(final_prices, discounts, cls.settings.PRICE_RANGES)
 
     @staticmethod
     def copy_to_history(items: Iterable["Item"]) -> None:
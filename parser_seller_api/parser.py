@@ -1,8 +1,6 @@
-import requests
-
 import core.service.parsing
 from core import models as core_models, parser as parser_core
-from core.service import parsing
+from core.service import http_client, parsing
 from parser_seller_api import models, settings
 
 
@@ -16,10 +14,8 @@ class Parser(parser_core.Parser):
 
     # https://openapi.wb.ru/prices/api/ru/#tag/Sostoyaniya-zagruzok/paths/~1api~1v2~1buffer~1goods~1task/get
     def make_request(self, user: core_models.ParserUser, offset: int) -> list[dict[str, int | str | list[dict]]]:
-        scheme = "https"
-        domain = "discounts-prices-api.wb.ru"
         path = "api/v2/list/goods/filter"
-        url = f"{scheme}://{domain}/{path}"
+        url = f"{self.settings.SELLER_API_BASE_URL}/{path}"
 
         headers = {"Authorization": user.seller_api_token}
         data_limit = 1000
@@ -27,7 +23,7 @@ class Parser(parser_core.Parser):
             "limit": data_limit,
             "offset": offset
         }
-        response = requests.get(url, params, headers = headers)
+        response = http_client.get(url, params, headers)
 
         if response.status_code != 200:
             error_text = f"{response}\n"